@@ -116,9 +116,9 @@ class CausalModule:
             self.learned_causal_subgraph[action] = [cause, effect]
 
     def get_llm_answer(self, messages):
-        for _ in range(self.max_llm_answer_num):
+        for attempt in range(self.max_llm_answer_num):
             try:
-                response_text = invoke_with_log(self.llm, messages, prefix="Causal ").content
+                response_text = invoke_with_log(self.llm, messages, prefix="Causal ", attempt=attempt).content
                 logger.info(f"\033[94mCausal AI message: {response_text}\033[0m")
                 return fix_and_parse_json(response_text)
             except Exception as e:
@@ -25,5 +25,5 @@ class DoNothing(Agent):
         run_threads([self.run_agent for _ in range(scenario.num_agents_per_team)], args=[[env] for env in agent_envs])
 
     def run_agent(self, agent_env: PillagerEnv):
-        agent_env.step("await bot.waitForTicks(9999999999);")
+        agent_env.step("await bot.waitForTicks(9999999999);", observe=[])
         logger.info(f"Agent {agent_env.username} finished")
@@ -46,7 +46,8 @@ class MushroomWarBase(Agent):
 
     def run_agent(self, agent_env: PillagerEnv, agent_script: str):
         for _ in range(10):
-            agent_env.step(agent_script)
+            # The scripts do not look at the observations
+            agent_env.step(agent_script, observe=[])
             # Stop if timeout
             if (0 < self.scenario.episode_timeout < time.time() - self.scenario.episode_start_time
                         and 0 < self.scenario.episode_start_time):
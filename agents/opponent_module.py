@@ -45,8 +45,8 @@ class OpponentModule:
             self.render_human_message(events, scenario, opponent_id),
         ]
 
-        for _ in range(3):
-            response = invoke_with_log(self.llm, messages, prefix="Opponent ")
+        for attempt in range(3):
+            response = invoke_with_log(self.llm, messages, prefix="Opponent ", attempt=attempt)
             content = response.content
 
             if '<think>' in content and '</think>' in content:
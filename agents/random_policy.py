@@ -107,7 +107,7 @@ class Random(Agent):
                 if i % 5 == 0:
                     agent_script += "await bot.waitForTicks(20);"
 
-            last_events = agent_env.step(agent_script)
+            last_events = agent_env.step(agent_script, observe=["voxels", "status"])
             # Stop if timeout
             if (0 < self.scenario.episode_timeout < time.time() - self.scenario.episode_start_time
                     and 0 < self.scenario.episode_start_time):
@@ -14,7 +14,8 @@ from bench.agent import Agent
 from bench.pillager_env import PillagerEnv
 from bench.scenario import Scenario
 from voyager import Voyager
-from voyager.llm import invoke_with_log
+from voyager.llm import invoke_with_log, invoke_batch_with_log, stream_with_log
+from voyager.llm_limiter import ACTION_PRIORITY
 
 logger = logging.getLogger(__name__)
 
@@ -34,6 +35,9 @@ class TactiCrafter(Agent):
 
         self.enable_causal = kwargs.get('enable_causal', True)
         self.enable_opponent = kwargs.get('enable_opponent', True)
+        # Start running the code of streamed action responses before their trailing text has arrived
+        self.stream_actions = kwargs.get('stream_actions', False)
+        self.streams = {}
 
         team_tactics = kwargs.get('team_tactics', None)
         negotiator_model_name = kwargs.get('negotiator_model_name', 'gpt-4o')
@@ -130,9 +134,9 @@ class TactiCrafter(Agent):
                 }
             } for i, agent in enumerate(self.agents)})
 
-        # get ai_message and parse in parallel
+        # get ai_message and parse for all agents in one batch
         logger.info('get_ai_message_parse')
-        self.result = self.run_threads(self.get_ai_message_parse)
+        self.result = self.get_ai_messages_parse()
 
     def run(self, scenario: Scenario, team_id: int, agent_envs: list[PillagerEnv]):
         # Assign environments to agents
@@ -147,6 +151,7 @@ class TactiCrafter(Agent):
         for _ in range(agent.action_agent_task_max_retries):
             parsed_result = self.result[agent.username]['parsed_result']
             events = self.env_step(agent, parsed_result)
+            self.finish_stream(agent)
 
             # Accumulate events for all retries
             if 'events' in self.result[agent.username]:
@@ -174,12 +179,19 @@ class TactiCrafter(Agent):
             self.get_ai_message_parse(agent, self.result[agent.username])
 
     def post_game(self, scenario: Scenario, team_id: int):
+        for agent in self.agents:
+            self.finish_stream(agent)
+
         # Remove duplicate events
         self.dedupe_results(self.result)
 
         # Save previous events, code, tactics, critique
         self.save_episode(self.result)
 
+        # The agents are created again next episode, with log files in its folder
+        for agent in self.agents:
+            agent.close_log()
+
     def dedupe_events(self, events):
         """
         When consecutive onChat events form a repeating block (by comparing the value of the "onChat" key),
@@ -272,11 +284,73 @@ class TactiCrafter(Agent):
     def get_ai_message_parse(self, agent, result):
         if agent.action_agent_rollout_num_iter < 0:
             raise ValueError("Agent must be reset before stepping")
-        ai_message = invoke_with_log(agent.action_agent.llm, agent.messages, prefix="Action ")
+        if self.stream_actions:
+            self.stream_ai_message_parse(agent, result)
+            return
+        ai_message = invoke_with_log(agent.action_agent.llm, agent.messages, prefix="Action ",
+                                     priority=ACTION_PRIORITY)
+        self.parse_ai_message(agent, ai_message, result)
+
+    # get ai_message of all agents with concurrent requests and parse
+    def get_ai_messages_parse(self):
+        if self.stream_actions:
+            return self.run_threads(self.get_ai_message_parse)
+        for agent in self.agents:
+            if agent.action_agent_rollout_num_iter < 0:
+                raise ValueError("Agent must be reset before stepping")
+        ai_messages = invoke_batch_with_log([{
+            "model": agent.action_agent.llm,
+            "messages": agent.messages,
+            "prefix": "Action ",
+            "priority": ACTION_PRIORITY,
+        } for agent in self.agents])
+        results = {}
+        for agent, ai_message in zip(self.agents, ai_messages):
+            results[agent.username] = {}
+            self.parse_ai_message(agent, ai_message, results[agent.username])
+        return results
+
+    # stream ai_message and parse it as soon as its code is complete
+    def stream_ai_message_parse(self, agent, result):
+        messages = list(agent.messages)
+        streamed = stream_with_log(agent.action_agent.llm, agent.messages, prefix="Action ",
+                                   priority=ACTION_PRIORITY)
+        parsed_result, elapsed_time = streamed.wait_for(agent.action_agent.partial_program_parser())
+        if not parsed_result:
+            # The response ended without a program, parse it like a complete response
+            self.parse_ai_message(agent, streamed.result(), result)
+            return
+        logger.info(f"{agent.username} time to first executable program: {elapsed_time:.2f}s")
+        self.streams[agent.username] = (streamed, messages, parsed_result)
+        result.update({'parsed_result': parsed_result})
+
+    # record the rest of a streamed ai_message, before the agent's messages change
+    def finish_stream(self, agent):
+        if agent.username not in self.streams:
+            return
+        streamed, messages, parsed_result = self.streams.pop(agent.username)
+        try:
+            ai_message = streamed.result()
+        except Exception as e:
+            # The program already ran, only the record of the response is lost
+            logger.warning(f"{agent.username} action response failed after its program was parsed: {e}")
+            return
+        self.record_ai_message(agent, messages, ai_message)
+        try:
+            complete_result = agent.action_agent.parse_program(ai_message.content)
+        except Exception:
+            complete_result = None
+        if complete_result != parsed_result:
+            logger.warning(f"{agent.username} ran a program that differs from the one of its complete response")
+
+    def record_ai_message(self, agent, messages, ai_message):
         agent.logger(f"\033[34m****Action Agent ai message****\n{ai_message.content}\033[0m")
         agent.conversations.append(
-            (agent.messages[0].content, agent.messages[1].content, ai_message.content)
+            (messages[0].content, messages[1].content, ai_message.content)
         )
+
+    def parse_ai_message(self, agent, ai_message, result):
+        self.record_ai_message(agent, agent.messages, ai_message)
         parsed_result = agent.action_agent.process_ai_message(message=ai_message)
         result.update({'parsed_result': parsed_result})
 
@@ -59,8 +59,8 @@ class TacticsModule:
             self.render_human_message(events, chest_memory, opp_tactics),
         ]
 
-        for _ in range(3):
-            response = invoke_with_log(self.llm, messages, prefix="Tactics ")
+        for attempt in range(3):
+            response = invoke_with_log(self.llm, messages, prefix="Tactics ", attempt=attempt)
             content = response.content
 
             if '<think>' in content and '</think>' in content:
@@ -103,6 +103,7 @@ class TacticsModule:
                                   team_name=team_id)
         negotiation.simulate()
         self.team_tactics = negotiation.get_tactics()
+        negotiation.close_log()
 
     def render_system_message(self, scenario, team_id, causal_graph):
         system_prompt = load_prompt("tactics_update")
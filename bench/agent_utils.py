@@ -1,7 +1,8 @@
+import asyncio
 import threading
 from pathlib import Path
 from string import Template
-from typing import Optional, Iterable
+from typing import Optional, Iterable, Awaitable
 
 
 def load_script(path: Path, info: Optional[dict[str, any]]) -> str:
@@ -43,3 +44,11 @@ def run_threads(targets, args: Optional[list[Iterable]] = None, shared_args: Opt
     if join:
         for thread in threads:
             thread.join()
+
+
+async def gather_with_timeout(awaitables: Iterable[Awaitable], timeout: Optional[float] = None) -> list:
+    """
+    Async counterpart of run_threads: runs the awaitables concurrently on the current event loop and returns their
+    results. If the timeout expires, the unfinished ones are cancelled and TimeoutError is raised.
+    """
+    return await asyncio.wait_for(asyncio.gather(*awaitables), timeout)
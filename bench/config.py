@@ -1,4 +1,4 @@
-from dataclasses import dataclass, MISSING
+from dataclasses import dataclass, field, MISSING
 from typing import Optional
 
 from hydra.core.config_store import ConfigStore
@@ -21,6 +21,25 @@ class Config:
     mc_port: int = 49172
     server_port: int = 3000
     env_wait_ticks: int = 80
+    env_quiet_ticks: int = 0  # 0 always waits env_wait_ticks after a step
+    num_servers: int = 1
+    server_port_stride: int = 16
+    episode_reset: str = "restart"  # restart or in_place
+    standby_server: bool = False
+    mineflayer: str = "process"  # process, pool or host
+    process_supervisor: bool = False  # read the output of all subprocesses on one thread (POSIX only)
+    resource_interval: float = 5  # seconds between samples of the processes' resources, 0 disables them
+    # Per kind of process (minecraft_server, mineflayer): rss_mb, cpu (percent), fds and threads, 0 for no limit
+    resource_budgets: dict[str, dict[str, float]] = field(default_factory=dict)
+    program_cache: bool = True
+    compile_cache: bool = True
+    delta_observations: bool = False
+    record_observations: bool = False  # write every observation to logs/.../observations/<username>.jsonl
+    llm_cache: str = "off"  # off, read_write or replay (only cached responses, misses are errors)
+    llm_cache_path: str = "./llm_cache.sqlite"
+    llm_cache_max_mb: float = 1024
+    # Per "<provider>/<model>" or "<provider>": rpm, tpm and concurrency shared by all LLM clients, 0 for no limit
+    llm_rate_limits: dict[str, dict[str, float]] = field(default_factory=dict)
 
 
 cs = ConfigStore.instance()
@@ -1,13 +1,45 @@
 import dataclasses
+import logging
+import re
 import shutil
+import threading
+import time
 from pathlib import Path
 from string import Template
+from typing import Optional, Iterator
 
+from bench.mc_server.world_snapshot import WorldSnapshot
 from voyager.env.process_monitor import SubprocessMonitor
 
+logger = logging.getLogger(__name__)
+
 SERVER_PATH = Path(__file__).parent
 SERVER_PROPERTIES_TEMPLATE_PATH = SERVER_PATH / "server_properties_template"
 SERVER_JAR_PATH = SERVER_PATH / "server.jar"
+INSTANCES_PATH = SERVER_PATH / "instances"
+
+# An axis-aligned box of blocks given by two opposite corners
+Bounds = tuple[tuple[int, int, int], tuple[int, int, int]]
+
+# Upper bound for the server boot, after which it is considered hung and stopped
+SERVER_READY_TIMEOUT = 300
+
+# The pristine copy of the arena used by in-place resets is kept this many blocks away along the x-axis
+ARENA_BACKUP_OFFSET = 1024
+MAX_CLONE_BLOCKS = 32768
+
+PLAYER_EVENT_MATCH = r": ([a-zA-Z0-9_]{2,16}) (joined|left) the game$"
+PLAYER_LIST_MATCH = r"There are (\d+) of a max of \d+ players online"
+FORCELOAD_MATCH = r"(to be force loaded|No chunks were marked)"
+# Console answers to commands that could not be executed
+COMMAND_ERROR_MATCH = r"(Unknown or incomplete command|Incorrect argument for command|No player was found|No entity was found|Expected .*<--\[HERE\])"
+CLONE_MATCH = r"(Successfully cloned \d+ block|No blocks were cloned|That position is not loaded|Too many blocks|cannot overlap)"
+
+ENTITY_CLEANUP_COMMANDS = [
+    "kill @e[type=minecraft:item]",
+    "kill @e[type=minecraft:experience_orb]",
+    "kill @e[type=minecraft:arrow]",
+]
 
 
 @dataclasses.dataclass
@@ -29,9 +61,32 @@ class McServer:
     def __init__(
             self,
             server_port: int = 3000,
+            instance_dir: Optional[Path] = None,
     ):
         self.server_port = server_port
+        # Every server instance needs its own working directory (server.properties, world copy, logs).
+        # The default instance runs directly in SERVER_PATH.
+        self.instance_dir = SERVER_PATH if instance_dir is None else Path(instance_dir)
+        if self.instance_dir != SERVER_PATH:
+            self._prepare_instance_dir()
         self.minecraft_server = self.get_minecraft_server_process()
+        self.command_lock = threading.RLock()
+        self.template_properties: Optional[ServerProperties] = None
+        self.world_path: Optional[Path] = None
+        self.arena: Optional[Bounds] = None
+        self.online_players: set[str] = set()
+        self.players_changed = threading.Condition()
+
+    def _prepare_instance_dir(self):
+        self.instance_dir.mkdir(parents=True, exist_ok=True)
+        shutil.copy2(SERVER_PATH / "eula.txt", self.instance_dir / "eula.txt")
+
+        # Share the libraries extracted by the server jar instead of extracting them again per instance
+        for name in ["libraries", "versions"]:
+            shared_path = SERVER_PATH / name
+            instance_path = self.instance_dir / name
+            if shared_path.exists() and not instance_path.exists():
+                instance_path.symlink_to(shared_path, target_is_directory=True)
 
     def get_minecraft_server_process(self):
         return SubprocessMonitor(
@@ -43,41 +98,94 @@ class McServer:
                 str(SERVER_JAR_PATH),
                 "nogui",
             ],
-            name="minecraft_server",
+            name="minecraft_server" if self.instance_dir == SERVER_PATH else f"minecraft_server_{self.instance_dir.name}",
             ready_match=r"Done \(\d*\.\d*s\)! For help, type \"help\"",
-            callback_match=r": ([a-zA-Z0-9_]{2,16}) joined the game$",
-            callback=self._op_everyone_callback,
-            cwd=SERVER_PATH,
+            callback_match=PLAYER_EVENT_MATCH,
+            callback=self._player_event_callback,
+            cwd=self.instance_dir,
         )
 
-    def _op_everyone_callback(self, match):
+    def _player_event_callback(self, match):
         if match is None:
             return
-        self.minecraft_server.process.stdin.write(f"op {match.group(1)}\n")
-        self.minecraft_server.process.stdin.flush()
+        player, event = match.group(1), match.group(2)
+        if event == "joined":
+            self.send_command(f"op {player}")
+        with self.players_changed:
+            if event == "joined":
+                self.online_players.add(player)
+            else:
+                self.online_players.discard(player)
+            self.players_changed.notify_all()
+
+    def wait_for_players(self, players: list[str], timeout: float = 30) -> float:
+        """
+        Waits until all given players have joined and have been made operators. Returns the time waited.
+        """
+        start_time = time.time()
+        with self.players_changed:
+            if not self.players_changed.wait_for(lambda: self.online_players.issuperset(players), timeout):
+                missing = sorted(set(players) - self.online_players)
+                raise TimeoutError(f"Players {missing} did not join within {timeout}s")
+        # The op commands were written when the players joined, so the next acknowledged command comes after them
+        self.send_commands([], timeout)
+        return time.time() - start_time
+
+    def send_command(self, command: str, ack_match: Optional[str] = None, timeout: float = 10) -> Optional[re.Match]:
+        """
+        Writes a command to the server console. If ack_match is given, waits for the first log line matching it.
+        """
+        if ack_match is None:
+            self.minecraft_server.write_line(command)
+            return None
+
+        with self.command_lock:
+            watcher = self.minecraft_server.watch(ack_match)
+            try:
+                self.minecraft_server.write_line(command)
+                match = watcher.wait(timeout)
+            finally:
+                self.minecraft_server.unwatch(watcher)
+
+        if match is None:
+            raise TimeoutError(f"Minecraft server did not acknowledge '{command}' within {timeout}s")
+        return match
+
+    def send_commands(self, commands: list[str], timeout: float = 10):
+        """
+        Writes commands to the server console and waits until all of them have been executed. Commands are written
+        without a leading slash. The first one the server rejects is logged as a warning.
+        """
+        with self.command_lock:
+            error_watcher = self.minecraft_server.watch(COMMAND_ERROR_MATCH) if commands else None
+            try:
+                for command in commands:
+                    self.minecraft_server.write_line(command)
+                # The console executes commands in order, so the answer to a final list acknowledges the whole batch
+                self.send_command("list", PLAYER_LIST_MATCH, timeout)
+            finally:
+                if error_watcher is not None:
+                    self.minecraft_server.unwatch(error_watcher)
+
+        if error_watcher is not None and error_watcher.match is not None:
+            logger.warning(f"Minecraft server rejected a command of the batch: {error_watcher.match.string.strip()}")
 
     def run(self, server_properties: ServerProperties, use_temp_world=True, reset_world=False):
         server_properties.server_port = self.server_port
+        self.template_properties = dataclasses.replace(server_properties)
+        self.world_path = self.instance_dir / server_properties.level_name
+        self.arena = None
 
         if use_temp_world:
             # Keep the original level as backup and run the benchmark in a copy
             copy_name = "world"
-            copy_path = SERVER_PATH / copy_name
+            copy_path = self.instance_dir / copy_name
             original_path = SERVER_PATH / server_properties.level_name
             server_properties.level_name = copy_name
+            self.world_path = copy_path
 
-            # Step 1: Remove all contents of the copy
-            if copy_path.exists() and copy_path.is_dir():
-                shutil.rmtree(copy_path)  # Remove the folder and its contents
-            copy_path.mkdir()  # Recreate the empty "world" folder
-
-            # Step 2: Copy contents of the original to the copy
-            for item in original_path.iterdir():
-                dest = copy_path / item.name
-                if item.is_dir():
-                    shutil.copytree(item, dest)
-                else:
-                    shutil.copy2(item, dest)
+            # Only the files that changed during the last episode are copied back
+            WorldSnapshot(original_path, copy_path).restore()
 
         # Load server_properties_template, replace values with server_properties, and write to server.properties
         with open(SERVER_PROPERTIES_TEMPLATE_PATH, "r") as fp:
@@ -86,19 +194,103 @@ class McServer:
             server_properties_dict = dataclasses.asdict(server_properties)
             result = template.safe_substitute(server_properties_dict)
 
-            with open(SERVER_PATH / "server.properties", "w") as f:
+            with open(self.instance_dir / "server.properties", "w") as f:
                 f.write(result)
 
         # Optionally delete the world folder
         if reset_world:
-            world_folder = SERVER_PATH / server_properties.level_name
+            world_folder = self.instance_dir / server_properties.level_name
             if world_folder.exists():
                 shutil.rmtree(world_folder)
 
         # Start the server
-        self.minecraft_server.run()
+        self.minecraft_server.run(timeout=SERVER_READY_TIMEOUT)
+
+    def can_reset_in_place(self, server_properties: ServerProperties) -> bool:
+        """
+        Whether the running server was started from the same world template and can be reset without a restart.
+        """
+        return (
+            self.is_running
+            and self.template_properties is not None
+            and self.world_path != SERVER_PATH / self.template_properties.level_name
+            and self.template_properties == dataclasses.replace(server_properties, server_port=self.server_port)
+        )
+
+    def prepare_in_place_reset(self, arena: Optional[Bounds]):
+        """
+        Keeps a pristine copy of the arena next to it so that reset_in_place can restore its blocks.
+        Must be called right after run(), before any player has changed the world.
+        """
+        self.arena = arena
+        if arena is None:
+            return
+
+        backup = _offset_bounds(arena, ARENA_BACKUP_OFFSET)
+        for (x1, _, z1), (x2, _, z2) in [arena, backup]:
+            self.send_command(f"forceload add {x1} {z1} {x2} {z2}", FORCELOAD_MATCH)
+        self._clone(arena, ARENA_BACKUP_OFFSET)
+
+    def reset_in_place(self, commands: Optional[list[str]] = None, timeout: float = 30) -> dict[str, float]:
+        """
+        Restores the world template while keeping the server process alive. Waits for all players to leave,
+        restores their player data, clears dropped entities, runs the given cleanup commands, and restores the
+        arena blocks (including chest contents) from the copy made by prepare_in_place_reset.
+
+        The vanilla server cannot reload region files of loaded chunks, so blocks are restored with /clone.
+        Mobs are not restored.
+
+        Returns the time spent in each phase.
+        """
+        timings = {}
+
+        start_time = time.time()
+        self.wait_for_players_left(timeout)
+        timings["players_left"] = time.time() - start_time
+
+        start_time = time.time()
+        self._restore_player_data()
+        timings["player_data"] = time.time() - start_time
+
+        start_time = time.time()
+        self.send_commands(ENTITY_CLEANUP_COMMANDS + (commands or []))
+        timings["commands"] = time.time() - start_time
+
+        if self.arena is not None:
+            start_time = time.time()
+            self._clone(_offset_bounds(self.arena, ARENA_BACKUP_OFFSET), -ARENA_BACKUP_OFFSET)
+            timings["arena"] = time.time() - start_time
+
+        logger.info("In-place reset: " + ", ".join(f"{phase} {t:.2f}s" for phase, t in timings.items()))
+        return timings
+
+    def wait_for_players_left(self, timeout: float = 30):
+        with self.players_changed:
+            if not self.players_changed.wait_for(lambda: not self.online_players, timeout):
+                raise TimeoutError(f"Players {sorted(self.online_players)} are still online after {timeout}s")
+
+    def _restore_player_data(self):
+        # Player data is read from disk when a player joins, so it can be restored while everybody is offline
+        WorldSnapshot(SERVER_PATH / self.template_properties.level_name, self.world_path).restore("playerdata")
+
+    def _clone(self, bounds: Bounds, offset_x: int, retries: int = 20):
+        for (x1, y1, z1), (x2, y2, z2) in _split_bounds(bounds):
+            command = f"clone {x1} {y1} {z1} {x2} {y2} {z2} {x1 + offset_x} {y1} {z1} replace"
+            for _ in range(retries):
+                result = self.send_command(command, CLONE_MATCH).group(1)
+                # Force loaded chunks are loaded asynchronously, so retry until they are available
+                if result != "That position is not loaded":
+                    break
+                time.sleep(0.25)
+            else:
+                raise TimeoutError(f"Chunks for '{command}' were not loaded")
+            if result in ["Too many blocks", "cannot overlap"]:
+                raise RuntimeError(f"Minecraft server rejected '{command}': {result}")
 
     def stop(self):
+        self.template_properties = None
+        with self.players_changed:
+            self.online_players.clear()
         self.minecraft_server.logger.info("Stopping subprocess.")
         if self.minecraft_server.process and self.minecraft_server.process.is_running():
             children = self.minecraft_server.process.children(recursive=True)
@@ -108,7 +300,29 @@ class McServer:
             if self.minecraft_server.process.is_running():
                 self.minecraft_server.process.terminate()
                 self.minecraft_server.process.wait()
+        self.minecraft_server.wait_exited(10)
 
     @property
     def is_running(self):
         return self.minecraft_server.is_running
+
+
+def _offset_bounds(bounds: Bounds, offset_x: int) -> Bounds:
+    (x1, y1, z1), (x2, y2, z2) = bounds
+    return (x1 + offset_x, y1, z1), (x2 + offset_x, y2, z2)
+
+
+def _split_bounds(bounds: Bounds) -> Iterator[Bounds]:
+    """
+    Splits bounds along the x-axis into boxes that are small enough for a single /clone.
+    """
+    (x1, y1, z1), (x2, y2, z2) = bounds
+    x1, x2 = min(x1, x2), max(x1, x2)
+    y1, y2 = min(y1, y2), max(y1, y2)
+    z1, z2 = min(z1, z2), max(z1, z2)
+    slice_size = (y2 - y1 + 1) * (z2 - z1 + 1)
+    if slice_size > MAX_CLONE_BLOCKS:
+        raise ValueError(f"Bounds are too large to clone: {bounds}")
+    width = MAX_CLONE_BLOCKS // slice_size
+    for x in range(x1, x2 + 1, width):
+        yield (x, y1, z1), (min(x + width - 1, x2), y2, z2)
@@ -0,0 +1,203 @@
+import dataclasses
+import errno
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+from pathlib import Path
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# ioctl request to share the data blocks of one file with another (btrfs, xfs, bcachefs, ...)
+FICLONE = 0x40049409
+
+# Files the server writes to a temporary file and then renames over the old one, which leaves any hardlinked
+# template file untouched. Region files are written in place and must never be hardlinked.
+RENAME_WRITTEN_FILES = {"level.dat", "level.dat_old", "icon.png"}
+RENAME_WRITTEN_DIRS = {"playerdata"}
+
+
+@dataclasses.dataclass
+class RestoreStats:
+    copied: int = 0
+    linked: int = 0
+    skipped: int = 0
+    removed: int = 0
+    bytes_copied: int = 0
+    seconds: float = 0
+
+    def __str__(self):
+        return (f"{self.copied} copied ({self.bytes_copied / 1e6:.1f} MB), {self.linked} linked, "
+                f"{self.skipped} unchanged, {self.removed} removed in {self.seconds:.2f}s")
+
+
+class WorldSnapshot:
+    """
+    Restores a world folder to a pristine template.
+
+    The first restore copies the whole template, sharing data blocks through reflinks where the filesystem
+    supports them and hardlinking the files the server only ever replaces by renaming. After each restore, the
+    size and mtime of every file in the world are recorded in an index next to it, so the next restore only copies
+    back the files that changed during the episode and deletes the files that were created.
+    """
+
+    def __init__(self, template_path: Path, world_path: Path, use_links: bool = True):
+        self.template_path = Path(template_path)
+        self.world_path = Path(world_path)
+        self.use_links = use_links
+        self.index_path = self.world_path.parent / f".{self.world_path.name}.snapshot.json"
+        self.reflink_supported = use_links
+
+    def restore(self, subdir: Optional[str] = None) -> RestoreStats:
+        """
+        Restores the world, or only the given subfolder of it, to the template and returns what was done.
+        """
+        start_time = time.time()
+        stats = RestoreStats()
+        index = self._load_index()
+        template_files = self._template_files(index["template"])
+
+        prefix = "" if subdir is None else subdir + "/"
+        world_files = {rel: st for rel, st in self._scan(self.world_path).items() if rel.startswith(prefix)}
+        world_index = index["world"]
+
+        for rel, st in world_files.items():
+            if rel not in template_files:
+                (self.world_path / rel).unlink()
+                world_index.pop(rel, None)
+                stats.removed += 1
+
+        for rel, template_entry in template_files.items():
+            if not rel.startswith(prefix):
+                continue
+            st = world_files.get(rel)
+            if st is not None and self._is_pristine(rel, st, template_entry, world_index.get(rel)):
+                stats.skipped += 1
+            else:
+                self._restore_file(rel, stats)
+            world_index[rel] = _file_stat(self.world_path / rel)
+
+        self._remove_empty_dirs(self.world_path / prefix if prefix else self.world_path)
+        self._save_index(index)
+
+        stats.seconds = time.time() - start_time
+        logger.info(f"Restored {self.world_path.name}{'/' + subdir if subdir else ''} "
+                    f"from {self.template_path.name}: {stats}")
+        return stats
+
+    def _is_pristine(self, rel: str, st: list, template_entry: dict, world_entry: Optional[list]) -> bool:
+        # Unchanged since the last restore, and that restore was made from the current template
+        if world_entry is not None and st == world_entry and not template_entry.get("changed", False):
+            return True
+        # Touched, but the content is still identical to the template
+        if st[0] == template_entry["stat"][0]:
+            return _sha1(self.world_path / rel) == template_entry["sha1"]
+        return False
+
+    def _restore_file(self, rel: str, stats: RestoreStats):
+        src = self.template_path / rel
+        dst = self.world_path / rel
+        dst.parent.mkdir(parents=True, exist_ok=True)
+        if dst.exists() or dst.is_symlink():
+            dst.unlink()
+
+        if self.use_links and _is_rename_written(rel):
+            try:
+                os.link(src, dst)
+                stats.linked += 1
+                return
+            except OSError:
+                pass
+
+        if self.reflink_supported:
+            try:
+                _reflink(src, dst)
+                stats.linked += 1
+                return
+            except OSError as e:
+                if e.errno not in (errno.EOPNOTSUPP, errno.ENOTTY, errno.EXDEV, errno.EINVAL, errno.ENOSYS):
+                    raise
+                logger.info(f"Reflinks are not supported for {self.world_path.parent}, falling back to copies")
+                self.reflink_supported = False
+                if dst.exists():
+                    dst.unlink()
+
+        shutil.copy2(src, dst)
+        stats.copied += 1
+        stats.bytes_copied += dst.stat().st_size
+
+    def _template_files(self, template_index: dict) -> dict:
+        """
+        Returns the template files with their stat and sha1, hashing only files that changed since the last call.
+        """
+        template_files = {}
+        for rel, st in self._scan(self.template_path).items():
+            entry = template_index.get(rel)
+            if entry is not None and entry["stat"] == st:
+                template_files[rel] = {**entry, "changed": False}
+            else:
+                template_files[rel] = {"stat": st, "sha1": _sha1(self.template_path / rel), "changed": True}
+        template_index.clear()
+        template_index.update({rel: {"stat": e["stat"], "sha1": e["sha1"]} for rel, e in template_files.items()})
+        return template_files
+
+    def _load_index(self) -> dict:
+        if self.world_path.exists() and self.index_path.exists():
+            try:
+                with open(self.index_path, "r") as f:
+                    index = json.load(f)
+                if index.get("template_path") == str(self.template_path):
+                    return index
+            except (OSError, ValueError):
+                logger.warning(f"Ignoring unreadable snapshot index {self.index_path}")
+        self.world_path.mkdir(parents=True, exist_ok=True)
+        return {"template_path": str(self.template_path), "template": {}, "world": {}}
+
+    def _save_index(self, index: dict):
+        tmp_path = self.index_path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(index, f)
+        os.replace(tmp_path, self.index_path)
+
+    @staticmethod
+    def _scan(root: Path) -> dict[str, list]:
+        files = {}
+        for dirpath, _, filenames in os.walk(root):
+            for filename in filenames:
+                path = Path(dirpath) / filename
+                files[path.relative_to(root).as_posix()] = _file_stat(path)
+        return files
+
+    @staticmethod
+    def _remove_empty_dirs(root: Path):
+        for dirpath, _, _ in sorted(os.walk(root), key=lambda w: len(w[0]), reverse=True):
+            if Path(dirpath) != root and not os.listdir(dirpath):
+                os.rmdir(dirpath)
+
+
+def _file_stat(path: Path) -> list:
+    st = path.stat()
+    return [st.st_size, st.st_mtime_ns]
+
+
+def _is_rename_written(rel: str) -> bool:
+    parts = rel.split("/")
+    return rel in RENAME_WRITTEN_FILES or (len(parts) == 2 and parts[0] in RENAME_WRITTEN_DIRS)
+
+
+def _reflink(src: Path, dst: Path):
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+    shutil.copystat(src, dst)
+
+
+def _sha1(path: Path) -> str:
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
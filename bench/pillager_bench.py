@@ -1,5 +1,7 @@
 import logging
 import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional
 
 from omegaconf import OmegaConf
 
@@ -9,21 +11,83 @@ from bench.agent_utils import run_threads
 from bench.config import Config, ScenarioConfig
 from bench.mc_server.mc_server import McServer
 from bench.pillager_env import PillagerEnv
+from bench.resource_monitor import ResourceMonitor
 from bench.scenario import Scenario
+from bench.server_pool import ServerPool, ServerSlot
+from bench.trace import EpisodeTrace
+from voyager.env import MineflayerPool, MineflayerHost
+from voyager.env.latency import merge_histograms
+from voyager.env.process_monitor import ProcessSupervisor, SubprocessMonitor
+from voyager import llm
+from voyager.llm_cache import LLMCache
 from scenarios import scenario_classes
 import voyager.utils as U
 
 logger = logging.getLogger(__name__)
 
+# Fixed waits that used to follow every reset: for node to exit, per bot, and for the server to op the bots. Without
+# the server log, resets still wait RESET_SETTLE_SLEEP.
+NODE_EXIT_SLEEP = 1
+RESET_SETTLE_SLEEP = 2
+
 
 class PillagerBench:
     def __init__(self, args: Config):
         self.args = args
-        self.mc_server = McServer(args.mc_port)
+        if args.process_supervisor:
+            SubprocessMonitor.default_supervisor = ProcessSupervisor()
+        if args.llm_cache != "off":
+            llm.set_response_cache(
+                LLMCache(args.llm_cache_path, args.llm_cache_max_mb, replay=args.llm_cache == "replay")
+            )
+        if args.llm_rate_limits:
+            llm.set_rate_limits(OmegaConf.to_container(args.llm_rate_limits))
+        self.server_pool = ServerPool(
+            num_servers=args.num_servers,
+            mc_port=args.mc_port,
+            server_port=args.server_port,
+            server_port_stride=args.server_port_stride,
+            # An in-place reset keeps the server running, so there is nothing to boot in the background
+            standby=args.standby_server and args.episode_reset == "restart",
+        )
+        # Resident mineflayer processes, shared by all episodes and keyed by server port
+        if args.mineflayer == "pool":
+            self.mineflayer_pool = MineflayerPool()
+        elif args.mineflayer == "host":
+            self.mineflayer_pool = MineflayerHost()
+        elif args.mineflayer == "process":
+            self.mineflayer_pool = None
+        else:
+            raise ValueError(f"Unknown mineflayer mode: {args.mineflayer}")
+        # Resource monitors of the running episodes, stopped in run() if an episode fails
+        self.resource_monitors: set[ResourceMonitor] = set()
 
     def run(self):
-        for scenario_i, scenario in enumerate(self.args.scenarios):
-            self.run_scenario(scenario_i, scenario)
+        try:
+            self.run_scenarios()
+        finally:
+            for resource_monitor in list(self.resource_monitors):
+                resource_monitor.stop()
+            # Servers that are reset in place are still running
+            self.server_pool.stop()
+            if self.mineflayer_pool is not None:
+                self.mineflayer_pool.stop()
+            llm.rate_limits.log_stats()
+
+    def run_scenarios(self):
+        if self.server_pool.size == 1:
+            for scenario_i, scenario in enumerate(self.args.scenarios):
+                self.run_scenario(scenario_i, scenario)
+            return
+
+        # Episodes of a scenario depend on each other through the agents' state, so scenarios run concurrently
+        # and every episode takes whichever server slot is free
+        logger.info(f"Running {len(self.args.scenarios)} scenarios on {self.server_pool.size} servers")
+        with ThreadPoolExecutor(max_workers=self.server_pool.size, thread_name_prefix="scenario") as executor:
+            futures = [executor.submit(self.run_scenario, scenario_i, scenario)
+                       for scenario_i, scenario in enumerate(self.args.scenarios)]
+        for future in futures:
+            future.result()
 
     def run_scenario(self, scenario_i: int, scenario_args: ScenarioConfig):
         logger.info(f"Running scenario {scenario_args.name}")
@@ -47,103 +111,213 @@ class PillagerBench:
 
         # Run the scenario
         for episode in range(scenario_args.num_episodes):
-            # Start a local Minecraft server
-            self.mc_server.run(scenario.world_info)
+            with self.server_pool.acquire() as slot:
+                trace = EpisodeTrace()
 
-            self.run_episode(episode, scenario, agents)
+                # Start a local Minecraft server or reset the running one
+                self.start_server(slot, scenario, trace)
 
-            # Stop the local Minecraft server
-            # time.sleep(10000)
-            self.mc_server.stop()
+                completed = False
+                try:
+                    self.run_episode(episode, scenario, agents, slot, trace,
+                                     boot_standby=episode < scenario_args.num_episodes - 1)
+                    completed = True
+                finally:
+                    # Stop the local Minecraft server unless the next episode resets it in place
+                    if not completed or self.args.episode_reset != "in_place":
+                        slot.mc_server.stop()
 
         # Collect data
         # Repeat with soft reset however many times
         # Repeat with hard reset for however many scenarios
         # Log results
 
-    def run_episode(self, episode_i: int, scenario: Scenario, agents: list[Agent]):
+    def start_server(self, slot: ServerSlot, scenario: Scenario, trace: EpisodeTrace):
+        mc_server = slot.mc_server
+        if self.args.episode_reset == "in_place" and mc_server.can_reset_in_place(scenario.world_info):
+            try:
+                with trace.phase("server_reset"):
+                    timings = mc_server.reset_in_place(U.reset_scores_teams_server_commands(scenario.team_names))
+                for phase, seconds in timings.items():
+                    trace.add_timing(f"server_reset/{phase}", seconds)
+                return
+            except (TimeoutError, RuntimeError) as e:
+                logger.warning(f"In-place reset failed, restarting the Minecraft server: {e}")
+
+        boot = self.server_pool.take_standby(slot, scenario.world_info)
+        if boot is not None:
+            start_time = time.time()
+            try:
+                boot_seconds = boot.wait()
+                wait_seconds = time.time() - start_time
+                trace.add_timing("standby_wait", wait_seconds)
+                trace.add_timing("standby_boot", boot_seconds)
+                trace.add_timing("standby_hidden", max(boot_seconds - wait_seconds, 0))
+                return
+            except RuntimeError as e:
+                logger.warning(f"{e}, starting the Minecraft server instead")
+                mc_server = slot.mc_server
+
+        # Stop a server that is still running a different world
+        mc_server.stop()
+        with trace.phase("server_start"):
+            mc_server.run(scenario.world_info)
+            if self.args.episode_reset == "in_place":
+                mc_server.prepare_in_place_reset(scenario.arena_bounds)
+
+    def run_episode(self, episode_i: int, scenario: Scenario, agents: list[Agent], slot: ServerSlot,
+                    trace: EpisodeTrace, boot_standby: bool = False):
         log_path = f"./logs/scenario{scenario.scenario_i}/episode{episode_i}"
         U.f_mkdir(log_path)
         scenario.episode_i = episode_i
         scenario.log_path = log_path
 
+        num_bots = scenario.num_judges + scenario.num_teams * scenario.num_agents_per_team
+        # In host mode all bots of the slot are served by one process on the slot's first port
+        port_step = 0 if self.args.mineflayer == "host" else 1
+        if self.server_pool.size > 1 and num_bots * port_step > self.args.server_port_stride:
+            raise ValueError(f"server_port_stride must be at least {num_bots} for this scenario")
+
         # Create the agent environments
-        logger.info("Creating agent environments...")
-        judges = []
-        server_port = self.args.server_port
-        for judge_i in range(scenario.num_judges):
-            env = PillagerEnv(
-                scenario,
-                episode_i,
-                mc_port=self.args.mc_port,
-                server_port=server_port,
-                username=scenario.judge_names[judge_i],
-                log_path=log_path,
-            )
-            judges.append(env)
-            server_port += 1
-
-        agent_envs = []
-        for team_i in range(scenario.num_teams):
-            team_envs = []
-            agent_envs.append(team_envs)
-            for agent_i in range(scenario.num_agents_per_team):
+        with trace.phase("create_envs"):
+            logger.info("Creating agent environments...")
+            judges = []
+            server_port = slot.server_port
+            for judge_i in range(scenario.num_judges):
                 env = PillagerEnv(
                     scenario,
                     episode_i,
-                    team_id=team_i,
-                    agent_id=agent_i,
-                    mc_port=self.args.mc_port,
+                    mc_port=slot.mc_port,
                     server_port=server_port,
-                    username=scenario.agent_names[team_i][agent_i],
+                    username=scenario.judge_names[judge_i],
                     log_path=log_path,
+                    mineflayer_pool=self.mineflayer_pool,
+                    program_cache=self.args.program_cache,
+                    compile_cache=self.args.compile_cache,
+                    delta_observations=self.args.delta_observations,
+                    record_observations=self.args.record_observations,
                 )
-                team_envs.append(env)
-                server_port += 1
+                judges.append(env)
+                server_port += port_step
+
+            agent_envs = []
+            for team_i in range(scenario.num_teams):
+                team_envs = []
+                agent_envs.append(team_envs)
+                for agent_i in range(scenario.num_agents_per_team):
+                    env = PillagerEnv(
+                        scenario,
+                        episode_i,
+                        team_id=team_i,
+                        agent_id=agent_i,
+                        mc_port=slot.mc_port,
+                        server_port=server_port,
+                        username=scenario.agent_names[team_i][agent_i],
+                        log_path=log_path,
+                        mineflayer_pool=self.mineflayer_pool,
+                        program_cache=self.args.program_cache,
+                        compile_cache=self.args.compile_cache,
+                        delta_observations=self.args.delta_observations,
+                        record_observations=self.args.record_observations,
+                    )
+                    team_envs.append(env)
+                    server_port += port_step
+
+        resource_monitor = self.start_resource_monitor(log_path, slot, agent_envs + [judges])
 
         # Reset the agents
-        logger.info("Resetting agents...")
-        self.reset_agents(agent_envs + [judges])
-        # TODO: Stop if some bots failed to start
+        with trace.phase("reset_agents"):
+            logger.info("Resetting agents...")
+            self.reset_agents(agent_envs + [judges], trace, slot.mc_server)
+            # TODO: Stop if some bots failed to start
 
         # Pre-game
-        logger.info("Running pre-pre-game...")
-        self.pre_pre_game(scenario, judges)
-        logger.info("Running scenario pre-game...")
-        scenario.episode_start_time = 0
-        scenario.pre_game(judges)
-        logger.info("Running agent pre-game...")
-        run_threads([agent.pre_game for agent in agents], args=[
-            [scenario, i, [e.last_events for e in agent_envs[i]]] for i in range(scenario.num_teams)
-        ])
+        with trace.phase("pre_game"):
+            logger.info("Running pre-pre-game...")
+            start_time = time.time()
+            scenario.mc_server = slot.mc_server
+            self.pre_pre_game(scenario, judges)
+            logger.info("Running scenario pre-game...")
+            scenario.episode_start_time = 0
+            scenario.pre_game(judges)
+            trace.add_timing("setup_commands", time.time() - start_time)
+            logger.info("Running agent pre-game...")
+            run_threads([agent.pre_game for agent in agents], args=[
+                [scenario, i, [e.last_events for e in agent_envs[i]]] for i in range(scenario.num_teams)
+            ])
 
         # Run the game
-        logger.info("Running the game...")
-        targets = [agent.run for agent in agents]
-        args = [[scenario, i, agent_env] for i, agent_env in enumerate(agent_envs)]
-        scenario.episode_start_time = time.time()
-        run_threads([scenario.run] + targets, args=[[judges]] + args)
-        logger.info("Resetting agents...")
-        self.reset_agents(agent_envs + [judges])
+        with trace.phase("game"):
+            logger.info("Running the game...")
+            targets = [agent.run for agent in agents]
+            args = [[scenario, i, agent_env] for i, agent_env in enumerate(agent_envs)]
+            scenario.episode_start_time = time.time()
+            run_threads([self.run_game] + targets, args=[[scenario, judges, agent_envs, trace]] + args)
+
+        with trace.phase("end_game"):
+            logger.info("Resetting agents...")
+            self.reset_agents(agent_envs + [judges], trace, slot.mc_server)
+
+        # Boot the next episode's server while the agents reflect on this one
+        if boot_standby:
+            self.server_pool.boot_standby(slot, scenario.world_info)
 
         # Post-game
-        logger.info("Running scenario post-game...")
-        scenario.episode_start_time = 0
-        scenario.post_game(judges)
-        logger.info("Running agent post-game...")
-        run_threads([agent.post_game for agent in agents], args=[[scenario, i] for i in range(scenario.num_teams)])
+        with trace.phase("post_game"):
+            logger.info("Running scenario post-game...")
+            scenario.episode_start_time = 0
+            scenario.post_game(judges)
+            logger.info("Running agent post-game...")
+            run_threads([agent.post_game for agent in agents], args=[[scenario, i] for i in range(scenario.num_teams)])
 
         # Disconnect all agents
-        logger.info("Closing agents...")
-        self.close_agents(agent_envs + [judges])
+        with trace.phase("close_agents"):
+            logger.info("Closing agents...")
+            self.close_agents(agent_envs + [judges])
+
+        if resource_monitor is not None:
+            resource_monitor.stop()
+            self.resource_monitors.discard(resource_monitor)
+            trace.record("resources", resource_monitor.summary())
 
+        all_envs = [env for team_envs in agent_envs + [judges] for env in team_envs]
+        trace.record("http_latency", merge_histograms(env.latency for env in all_envs))
+        trace.record("step_requests", {
+            key: round(sum(env.step_stats[key] for env in all_envs), 3) for key in all_envs[0].step_stats
+        })
+        trace.save(log_path)
+        logger.info(f"Readiness signals saved {trace.timings.get('sleep_saved', 0):.2f}s of fixed sleeps")
         logger.info("Episode complete")
 
+    def start_resource_monitor(self, log_path: str, slot: ServerSlot,
+                               agent_envs: list[list[PillagerEnv]]) -> Optional[ResourceMonitor]:
+        if self.args.resource_interval <= 0:
+            return None
+        budgets = OmegaConf.to_container(self.args.resource_budgets) if self.args.resource_budgets else {}
+        resource_monitor = ResourceMonitor(log_path, self.args.resource_interval, budgets)
+        resource_monitor.track("minecraft_server", slot.mc_server.minecraft_server)
+        for team_envs in agent_envs:
+            for env in team_envs:
+                resource_monitor.track("mineflayer", env.env.mineflayer)
+        resource_monitor.start()
+        self.resource_monitors.add(resource_monitor)
+        return resource_monitor
+
+    def run_game(self, scenario: Scenario, judges: list[PillagerEnv], agent_envs: list[list[PillagerEnv]],
+                 trace: EpisodeTrace):
+        scenario.run(judges)
+        # The game is over, don't let steps that are still running hold up the episode
+        start_time = time.time()
+        run_threads([env.cancel for team_envs in agent_envs for env in team_envs])
+        trace.add_timing("cancel_steps", time.time() - start_time)
+        logger.info("Cancelled the running agent steps")
+
     def pre_pre_game(self, scenario: Scenario, judges: list[PillagerEnv]):
-        judges[0].step(
-            U.spawn_commands_2(scenario.agent_names, scenario.spawn_locations)
-            + U.gamemode_commands(scenario.agent_names, "survival")
-            + U.scores_teams_commands(scenario.agent_names, scenario.team_names, scenario.team_colors)
+        scenario.run_commands(
+            judges[0],
+            U.spawn_server_commands_2(scenario.agent_names, scenario.spawn_locations)
+            + U.gamemode_server_commands(scenario.agent_names, "survival")
+            + U.scores_teams_server_commands(scenario.agent_names, scenario.team_names, scenario.team_colors),
         )
 
     def load_agent(self, agent_name: str, agent_kwargs: dict = None) -> Agent:
@@ -154,11 +328,38 @@ class PillagerBench:
             kwargs.update(agent_kwargs)
         return agent_classes[agent_name](**kwargs)
 
-    def reset_agents(self, agent_envs: list[list[PillagerEnv]], mode='soft', timeout=2):
-        shared_kwargs = {'options': {'mode': mode, 'wait_ticks': self.args.env_wait_ticks}}
-        targets = [env.reset for team_envs in agent_envs for env in team_envs]
-        run_threads(targets, shared_kwargs=shared_kwargs)
-        time.sleep(timeout)
+    def reset_agents(self, agent_envs: list[list[PillagerEnv]], trace: EpisodeTrace,
+                     mc_server: Optional[McServer] = None, mode='soft', timeout=30):
+        shared_kwargs = {'options': {
+            'mode': mode, 'wait_ticks': self.args.env_wait_ticks, 'quiet_ticks': self.args.env_quiet_ticks,
+        }}
+        envs = [env for team_envs in agent_envs for env in team_envs]
+        run_threads([env.reset for env in envs], shared_kwargs=shared_kwargs)
+
+        if mc_server is None:
+            # Without the server log there is no signal for when the bots have been made operators
+            time.sleep(RESET_SETTLE_SLEEP)
+            return
+
+        # Every bot has spawned once its reset returns, so only wait for the server to op them
+        usernames = [env.username for env in envs]
+        start_time = time.time()
+        try:
+            mc_server.wait_for_players(usernames, timeout)
+        except TimeoutError as e:
+            # Play on with the bots that did join, as when the episode relied on a fixed sleep
+            logger.warning(f"Continuing the episode without all bots: {e}")
+            with mc_server.players_changed:
+                missing = set(usernames) - mc_server.online_players
+            trace.record("missing_players", sorted(set(trace.metrics.get("missing_players", [])) | missing))
+        ready_wait = time.time() - start_time
+        trace.add_timing("ready_wait", ready_wait)
+        trace.add_timing("bot_spawn", max(env.reset_timings.get("spawn", 0) for env in envs))
+
+        # The readiness waits that replaced the fixed sleeps: each bot's wait for node to exit, and the ready wait
+        stop_wait = sum(env.reset_timings.get("stop", 0) for env in envs)
+        fixed_sleeps = NODE_EXIT_SLEEP * len(envs) + RESET_SETTLE_SLEEP
+        trace.add_timing("sleep_saved", max(0.0, fixed_sleeps - stop_wait - ready_wait))
 
     def close_agents(self, agent_envs: list[list[PillagerEnv]]):
         targets = [env.close for team_envs in agent_envs for env in team_envs]
@@ -1,14 +1,19 @@
+import asyncio
 import logging
 import time
+import uuid
 from string import Template
 from typing import Dict, Tuple, SupportsFloat, Any, Optional
 
+import httpx
+import requests
 from gymnasium.core import ObsType
 
 import voyager.utils as U
 from bench.scenario import Scenario
 from voyager.control_primitives import load_control_primitives_string
-from voyager.env import VoyagerEnv
+from voyager.env import VoyagerEnv, MineflayerPool
+from voyager.env.latency import LatencyHistogram
 
 logger = logging.getLogger(__name__)
 
@@ -29,6 +34,11 @@ class PillagerEnv:
             polling_timeout=600,
             polling_interval=1,
             log_path="./logs",
+            mineflayer_pool: Optional[MineflayerPool] = None,
+            program_cache: bool = True,
+            compile_cache: bool = True,
+            delta_observations: bool = False,
+            record_observations: bool = False,
     ):
         self.scenario = scenario
         self.episode = episode
@@ -57,8 +67,26 @@ class PillagerEnv:
             polling_timeout=polling_timeout,
             polling_interval=polling_interval,
             log_path=self.log_path,
+            mineflayer_pool=mineflayer_pool,
+            program_cache=program_cache,
+            compile_cache=compile_cache,
+            delta_observations=delta_observations,
+            observation_log=U.f_join(U.f_mkdir(log_path, "observations"), f"{username}.jsonl")
+            if record_observations else None,
         )
 
+    @property
+    def reset_timings(self) -> dict[str, float]:
+        return self.env.reset_timings
+
+    @property
+    def latency(self) -> dict[str, LatencyHistogram]:
+        return self.env.latency
+
+    @property
+    def step_stats(self) -> dict[str, float]:
+        return self.env.step_stats
+
     def reset(
         self,
         *,
@@ -71,6 +99,24 @@ class PillagerEnv:
         )
         return self.last_events
 
+    async def areset(
+        self,
+        *,
+        seed=None,
+        options=None,
+    ) -> list[tuple[str, dict[str, any]]]:
+        self.last_events = await self.env.areset(
+            seed=seed,
+            options=options,
+        )
+        return self.last_events
+
+    def cancel(self):
+        try:
+            self.env.cancel()
+        except (requests.RequestException, RuntimeError) as e:
+            logger.warning(f"Could not cancel the step of {self.username}: {e}")
+
     def close(self):
         for retry in range(3):
             try:
@@ -80,27 +126,33 @@ class PillagerEnv:
                 logger.info('bot close failed, retrying...')
                 continue
 
+    async def aclose(self):
+        for retry in range(3):
+            try:
+                await self.env.aclose()
+                break
+            except httpx.TransportError:
+                logger.info('bot close failed, retrying...')
+                continue
+
     def step(
         self,
         code: str,
         programs: Optional[str] = None,
+        observe: Optional[list[str]] = None,
     ) -> Tuple[ObsType, SupportsFloat, bool, bool, Dict[str, Any]]:
-        # Add timeout if episode_timeout is set and we have started the episode
-        if self.scenario.episode_timeout > 0 and self.scenario.episode_start_time > 0:
-            timeout = self.scenario.episode_timeout - (time.time() - self.scenario.episode_start_time)
-            code = self.get_code_with_timeout(code, timeout)
-
-        # Increment the team score for the reward items in the bot's possession
-        if self.reward_item_names is not None and len(self.reward_item_names) != 0:
-            code = (f"await scoreRewards(bot, {U.json_dumps(self.reward_item_names)}, {U.json_dumps(self.team_name)});"
-                    + code)
+        code = self.prepare_code(code)
 
+        # Retries keep the ID, so the server never runs the same step twice
+        step_id = uuid.uuid4().hex
         fail_count = 0
         while True:
             try:
                 self.last_events = self.env.step(
                     code,
                     programs=self.base_programs + (programs or self.scenario_programs),
+                    observe=observe,
+                    step_id=step_id,
                 )
                 break
             except Exception as e:
@@ -108,11 +160,71 @@ class PillagerEnv:
                     raise e
                 logger.error(f"Error in step: {e}")
                 fail_count += 1
+                # The step may still be running or be finished, only run it again if the server lost it
+                try:
+                    events = self.env.reattach(step_id)
+                except Exception as reattach_error:
+                    logger.error(f"Error reattaching to step: {reattach_error}")
+                    events = None
+                if events is not None:
+                    self.last_events = events
+                    break
                 self.env.restart_mineflayer()
+                self.env.step_stats["step_retries"] += 1
                 time.sleep(1)
 
         return self.last_events
 
+    async def astep(
+        self,
+        code: str,
+        programs: Optional[str] = None,
+        observe: Optional[list[str]] = None,
+    ) -> Tuple[ObsType, SupportsFloat, bool, bool, Dict[str, Any]]:
+        code = self.prepare_code(code)
+
+        step_id = uuid.uuid4().hex
+        fail_count = 0
+        while True:
+            try:
+                self.last_events = await self.env.astep(
+                    code,
+                    programs=self.base_programs + (programs or self.scenario_programs),
+                    observe=observe,
+                    step_id=step_id,
+                )
+                break
+            except Exception as e:
+                if fail_count > 5:
+                    raise e
+                logger.error(f"Error in step: {e}")
+                fail_count += 1
+                try:
+                    events = await self.env.areattach(step_id)
+                except Exception as reattach_error:
+                    logger.error(f"Error reattaching to step: {reattach_error}")
+                    events = None
+                if events is not None:
+                    self.last_events = events
+                    break
+                await self.env.arestart_mineflayer()
+                self.env.step_stats["step_retries"] += 1
+                await asyncio.sleep(1)
+
+        return self.last_events
+
+    def prepare_code(self, code: str) -> str:
+        # Add timeout if episode_timeout is set and we have started the episode
+        if self.scenario.episode_timeout > 0 and self.scenario.episode_start_time > 0:
+            timeout = self.scenario.episode_timeout - (time.time() - self.scenario.episode_start_time)
+            code = self.get_code_with_timeout(code, timeout)
+
+        # Increment the team score for the reward items in the bot's possession
+        if self.reward_item_names is not None and len(self.reward_item_names) != 0:
+            code = (f"await scoreRewards(bot, {U.json_dumps(self.reward_item_names)}, {U.json_dumps(self.team_name)});"
+                    + code)
+        return code
+
     def get_code_with_timeout(self, code: str, timeout: float) -> str:
         template = Template("""
 async function mainFunction(bot) {
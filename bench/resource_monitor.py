@@ -0,0 +1,123 @@
+import json
+import logging
+import threading
+import time
+from typing import Optional
+
+import psutil
+
+import voyager.utils as U
+from voyager.env.process_monitor import SubprocessMonitor
+
+logger = logging.getLogger(__name__)
+
+METRICS = ["rss_mb", "cpu", "fds", "threads"]
+
+
+class ResourceMonitor:
+    """
+    Samples the memory, CPU, file descriptor and thread usage of the processes of an episode.
+
+    Every interval, one line per running process is appended to resources.jsonl in the episode log folder:
+    {"t": seconds since start, "name": ..., "pid": ..., "rss_mb": ..., "cpu": percent, "fds": ..., "threads": ...}.
+    Processes are tracked under a kind, e.g. "minecraft_server" or "mineflayer", whose budgets ({"rss_mb": ...,
+    "cpu": ..., "fds": ..., "threads": ...}) are checked on every sample. Exceedances are logged when they first occur.
+    """
+
+    def __init__(self, log_path: str, interval: float = 5, budgets: Optional[dict[str, dict[str, float]]] = None):
+        self.path = U.f_join(log_path, "resources.jsonl")
+        self.interval = interval
+        self.budgets = budgets or {}
+        self.monitors: dict[str, tuple[str, SubprocessMonitor]] = {}
+        self.peaks: dict[str, dict[str, float]] = {}
+        self.exceedances: dict[tuple[str, str], dict] = {}
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+        self.start_time = 0.0
+
+    def track(self, kind: str, monitor: SubprocessMonitor):
+        """
+        Samples the process of monitor, also after it has been restarted. Monitors are tracked by name.
+        """
+        with self.lock:
+            self.monitors[monitor.name] = (kind, monitor)
+
+    def start(self):
+        self.start_time = time.time()
+        self.thread = threading.Thread(target=self._loop, name="resource_monitor", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if self.thread is None:
+            return
+        self.stop_event.set()
+        self.thread.join()
+        self.thread = None
+
+    def _loop(self):
+        with open(self.path, "a") as f:
+            while not self.stop_event.is_set():
+                for sample in self.sample():
+                    f.write(json.dumps(sample, separators=(",", ":")) + "\n")
+                f.flush()
+                self.stop_event.wait(self.interval)
+
+    def sample(self) -> list[dict]:
+        with self.lock:
+            monitors = list(self.monitors.items())
+
+        samples = []
+        t = round(time.time() - self.start_time, 1)
+        for name, (kind, monitor) in monitors:
+            process = monitor.process
+            if process is None or not monitor.is_running:
+                continue
+            try:
+                with process.oneshot():
+                    sample = {
+                        "t": t,
+                        "name": name,
+                        "pid": process.pid,
+                        "rss_mb": round(process.memory_info().rss / 1e6, 1),
+                        # Relative to the previous sample, the first one of a process is 0
+                        "cpu": process.cpu_percent(),
+                        # Windows has no file descriptors, its handles are the closest equivalent
+                        "fds": process.num_fds() if psutil.POSIX else process.num_handles(),
+                        "threads": process.num_threads(),
+                    }
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                continue
+            samples.append(sample)
+            with self.lock:
+                self._check(kind, sample)
+        return samples
+
+    def _check(self, kind: str, sample: dict):
+        # Called with the lock held
+        name = sample["name"]
+        peaks = self.peaks.setdefault(name, {})
+        for metric in METRICS:
+            peaks[metric] = max(peaks.get(metric, 0), sample[metric])
+        for metric, budget in self.budgets.get(kind, {}).items():
+            value = sample[metric]
+            if not budget or value <= budget:
+                continue
+            exceedance = self.exceedances.get((name, metric))
+            if exceedance is None:
+                logger.warning(f"{name} exceeds its {metric} budget: {value} > {budget}")
+                self.exceedances[(name, metric)] = {
+                    "name": name, "metric": metric, "budget": budget, "first_t": sample["t"], "peak": value,
+                }
+            else:
+                exceedance["peak"] = max(exceedance["peak"], value)
+
+    def summary(self) -> dict:
+        """
+        Returns the peak of every metric per process and the budgets that were exceeded.
+        """
+        with self.lock:
+            return {
+                "peaks": {name: dict(peaks) for name, peaks in self.peaks.items()},
+                "exceeded": [dict(exceedance) for exceedance in self.exceedances.values()],
+            }
@@ -1,6 +1,9 @@
 import abc
 
-from bench.mc_server.mc_server import ServerProperties
+from typing import Optional
+
+import voyager.utils as U
+from bench.mc_server.mc_server import ServerProperties, Bounds, McServer
 from voyager.control_primitives import load_control_primitives_string
 
 
@@ -11,6 +14,8 @@ class Scenario(abc.ABC):
         self.log_path = "./logs"
         self.episode_start_time = 0
         self.episode_timeout = 0
+        # The server of the current episode, whose console runs setup commands
+        self.mc_server: Optional[McServer] = None
 
     @property
     @abc.abstractmethod
@@ -90,6 +95,11 @@ class Scenario(abc.ABC):
     def world_info(self) -> ServerProperties:
         return ServerProperties()
 
+    @property
+    def arena_bounds(self) -> Optional[Bounds]:
+        # Blocks restored between episodes when the server is reset in place
+        return None
+
     @property
     @abc.abstractmethod
     def agent_names(self) -> list[list[str]]:
@@ -100,6 +110,16 @@ class Scenario(abc.ABC):
     def spawn_locations(self) -> list[list[tuple[int, int, int]]]:
         pass
 
+    def run_commands(self, env, commands: list[str]):
+        """
+        Runs server commands (without leading slash) on the server console, or as chat commands of env's bot if the
+        episode has no server.
+        """
+        if self.mc_server is not None:
+            self.mc_server.send_commands(commands)
+        else:
+            env.step(U.chat_commands(commands), observe=[])
+
     @abc.abstractmethod
     def pre_game(self, envs):
         pass
@@ -0,0 +1,149 @@
+import contextlib
+import dataclasses
+import logging
+import queue
+import threading
+import time
+from typing import Optional
+
+from bench.mc_server.mc_server import McServer, ServerProperties, INSTANCES_PATH
+
+logger = logging.getLogger(__name__)
+
+
+class StandbyBoot:
+    """
+    Boots a standby Minecraft server in a background thread.
+    """
+
+    def __init__(self, mc_server: McServer, server_properties: ServerProperties):
+        self.mc_server = mc_server
+        self.server_properties = dataclasses.replace(server_properties)
+        self.boot_seconds: Optional[float] = None
+        self.error: Optional[Exception] = None
+        self.thread = threading.Thread(target=self._boot, name=f"standby_boot_{mc_server.server_port}", daemon=True)
+        self.thread.start()
+
+    def _boot(self):
+        start_time = time.time()
+        try:
+            # McServer.run modifies the properties, so keep the original for matching
+            self.mc_server.run(dataclasses.replace(self.server_properties))
+        except Exception as e:
+            self.error = e
+        self.boot_seconds = time.time() - start_time
+
+    def wait(self) -> float:
+        """
+        Waits until the server has booted and returns how long the boot took.
+        """
+        self.thread.join()
+        if self.error is not None:
+            raise RuntimeError(f"Standby server on port {self.mc_server.server_port} failed to boot: {self.error}")
+        if not self.mc_server.is_running:
+            raise RuntimeError(f"Standby server on port {self.mc_server.server_port} is not running")
+        return self.boot_seconds
+
+
+@dataclasses.dataclass
+class ServerSlot:
+    index: int
+    mc_server: McServer
+    mc_port: int
+    server_port: int
+    standby_server: Optional[McServer] = None
+    standby_boot: Optional[StandbyBoot] = None
+
+
+class ServerPool:
+    """
+    A fixed set of Minecraft server slots. Each slot owns its own McServer instance directory, Minecraft port,
+    and a range of mineflayer server ports starting at server_port, so episodes on different slots can run
+    concurrently without sharing any ports or files.
+
+    With standby enabled, every slot also owns a second McServer on its own port and instance directory. The
+    standby boots the next episode's world while the current episode is finishing and then takes over the slot.
+    """
+
+    def __init__(
+            self,
+            num_servers: int = 1,
+            mc_port: int = 49172,
+            server_port: int = 3000,
+            server_port_stride: int = 16,
+            standby: bool = False,
+    ):
+        if num_servers < 1:
+            raise ValueError("num_servers must be at least 1")
+
+        self.slots = []
+        self.free_slots = queue.Queue()
+        for i in range(num_servers):
+            # The first slot runs in the default server directory, the others in their own instance directories
+            instance_dir = None if i == 0 else INSTANCES_PATH / f"slot{i}"
+            slot = ServerSlot(
+                index=i,
+                mc_server=McServer(mc_port + i, instance_dir=instance_dir),
+                mc_port=mc_port + i,
+                server_port=server_port + i * server_port_stride,
+            )
+            if standby:
+                # Standby servers use the ports right after those of the active servers
+                slot.standby_server = McServer(mc_port + num_servers + i,
+                                               instance_dir=INSTANCES_PATH / f"slot{i}_standby")
+            self.slots.append(slot)
+            self.free_slots.put(slot)
+
+    @property
+    def size(self) -> int:
+        return len(self.slots)
+
+    @contextlib.contextmanager
+    def acquire(self):
+        slot = self.free_slots.get()
+        logger.info(f"Acquired server slot {slot.index} (mc_port={slot.mc_port}, server_port={slot.server_port})")
+        try:
+            yield slot
+        finally:
+            self.free_slots.put(slot)
+
+    def boot_standby(self, slot: ServerSlot, server_properties: ServerProperties):
+        """
+        Starts booting the slot's standby server with the given world, if the slot has one.
+        """
+        if slot.standby_server is None or slot.standby_boot is not None:
+            return
+        logger.info(f"Booting standby server on port {slot.standby_server.server_port}")
+        slot.standby_boot = StandbyBoot(slot.standby_server, server_properties)
+
+    def take_standby(self, slot: ServerSlot, server_properties: ServerProperties) -> Optional[StandbyBoot]:
+        """
+        Stops the slot's active server and swaps in the standby server if it was booted with the given world.
+        Must be called while no agents are connected to the slot. Returns the standby boot, or None if there
+        is no matching standby.
+        """
+        boot = slot.standby_boot
+        if boot is None:
+            return None
+        slot.standby_boot = None
+
+        if boot.server_properties != server_properties:
+            logger.info(f"Standby server on port {boot.mc_server.server_port} runs a different world, stopping it")
+            boot.thread.join()
+            boot.mc_server.stop()
+            return None
+
+        slot.mc_server.stop()
+        slot.mc_server, slot.standby_server = slot.standby_server, slot.mc_server
+        slot.mc_port = slot.mc_server.server_port
+        logger.info(f"Server slot {slot.index} switched to mc_port={slot.mc_port}")
+        return boot
+
+    def stop(self):
+        for slot in self.slots:
+            if slot.standby_boot is not None:
+                slot.standby_boot.thread.join()
+                slot.standby_boot = None
+            slot.mc_server.stop()
+            if slot.standby_server is not None:
+                slot.standby_server.stop()
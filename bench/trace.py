@@ -0,0 +1,45 @@
+import contextlib
+import logging
+import threading
+import time
+from typing import Any
+
+import voyager.utils as U
+
+logger = logging.getLogger(__name__)
+
+
+class EpisodeTrace:
+    """
+    Collects phase timings and metrics of a single episode and saves them as trace.json in the episode log folder.
+    """
+
+    def __init__(self):
+        self.timings: dict[str, float] = {}
+        self.metrics: dict[str, Any] = {}
+        self.lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        start_time = time.time()
+        try:
+            yield
+        finally:
+            self.add_timing(name, time.time() - start_time)
+
+    def add_timing(self, name: str, seconds: float):
+        with self.lock:
+            self.timings[name] = self.timings.get(name, 0) + seconds
+
+    def record(self, name: str, value: Any):
+        with self.lock:
+            self.metrics[name] = value
+
+    def save(self, log_path: str):
+        with self.lock:
+            trace = {
+                "timings": {name: round(seconds, 3) for name, seconds in self.timings.items()},
+                "metrics": self.metrics,
+            }
+        U.dump_json(trace, U.f_join(log_path, "trace.json"), indent=4)
+        logger.info("Episode timings: " + ", ".join(f"{name} {seconds:.2f}s" for name, seconds in self.timings.items()))
@@ -0,0 +1,191 @@
+"""
+Micro-benchmarks for the environment layer. Run e.g.
+
+    python benchmark_env.py mineflayer --bots 6 --scenario "Mushroom War"
+    python benchmark_env.py step --steps 50
+    python benchmark_env.py observations logs/<run>/<episode>/observations/*.jsonl
+"""
+import argparse
+import json
+import logging
+import os.path
+import subprocess
+import tempfile
+import time
+
+from bench.agent_utils import run_threads
+from bench.mc_server.mc_server import McServer
+from scenarios import scenario_classes
+from voyager.control_primitives import load_control_primitives_string
+from voyager.env import VoyagerEnv, MineflayerHost
+from voyager.env.obs_delta import ObservationDecoder
+
+logger = logging.getLogger(__name__)
+
+
+def node_memory(envs: list[VoyagerEnv]) -> int:
+    """
+    Returns the total resident memory of the distinct node processes serving the given environments.
+    """
+    processes = {env.mineflayer.process.pid: env.mineflayer.process for env in envs if env.mineflayer.is_running}
+    return sum(process.memory_info().rss for process in processes.values())
+
+
+def benchmark_mineflayer_layout(layout: str, args, mc_server: McServer) -> dict:
+    pool = MineflayerHost() if layout == "host" else None
+    log_path = tempfile.mkdtemp(prefix=f"benchmark_mineflayer_{layout}_")
+    envs = [
+        VoyagerEnv(
+            mc_port=args.mc_port,
+            username=f"bench{i}",
+            server_port=args.server_port if layout == "host" else args.server_port + i,
+            log_path=log_path,
+            mineflayer_pool=pool,
+        )
+        for i in range(args.bots)
+    ]
+
+    start_time = time.time()
+    run_threads([env.reset for env in envs], shared_kwargs={"options": {"mode": "soft", "wait_ticks": 5}})
+    mc_server.wait_for_players([env.username for env in envs])
+    startup = time.time() - start_time
+    memory = node_memory(envs)
+
+    run_threads([env.close for env in envs])
+    if pool is not None:
+        pool.stop()
+    mc_server.wait_for_players_left()
+
+    return {
+        "layout": layout,
+        "bots": args.bots,
+        "startup_s": round(startup, 2),
+        "memory_mb": round(memory / 1e6, 1),
+        "memory_per_bot_mb": round(memory / 1e6 / args.bots, 1),
+    }
+
+
+def benchmark_mineflayer(args):
+    mc_server = McServer(args.mc_port)
+    mc_server.run(scenario_classes[args.scenario]().world_info)
+    try:
+        results = [benchmark_mineflayer_layout(layout, args, mc_server) for layout in ["process", "host"]]
+    finally:
+        mc_server.stop()
+
+    for result in results:
+        print(f"{result['layout']:>8}: {result['bots']} bots started in {result['startup_s']:.2f}s, "
+              f"{result['memory_mb']:.1f} MB node memory ({result['memory_per_bot_mb']:.1f} MB per bot)")
+    return results
+
+
+def benchmark_step_setup(compile_cache: bool, args, programs: str) -> dict:
+    env = VoyagerEnv(
+        mc_port=args.mc_port,
+        username="bench",
+        server_port=args.server_port,
+        log_path=tempfile.mkdtemp(prefix="benchmark_step_"),
+        compile_cache=compile_cache,
+    )
+    env.reset(options={"mode": "soft", "wait_ticks": 1})
+    for _ in range(args.steps):
+        env.step("bot.chat('step');", programs=programs)
+    env.close()
+
+    return {
+        "compile_cache": compile_cache,
+        "steps": args.steps,
+        "setup_ms": round(env.step_stats["server_setup_ms"] / args.steps, 3),
+    }
+
+
+def benchmark_step(args):
+    mc_server = McServer(args.mc_port)
+    mc_server.run(scenario_classes[args.scenario]().world_info)
+    programs = load_control_primitives_string()
+    try:
+        results = [benchmark_step_setup(compile_cache, args, programs) for compile_cache in [False, True]]
+    finally:
+        mc_server.stop()
+
+    for result in results:
+        label = "cached" if result["compile_cache"] else "uncached"
+        print(f"{label:>8}: {result['setup_ms']:.3f} ms step setup on average over {result['steps']} steps")
+    return results
+
+
+def benchmark_observation_log(path: str) -> dict:
+    with open(path, "r") as f:
+        observations = [line for line in f if line.strip()]
+    # Encode the recorded observations with the server's own encoder
+    delta_js = os.path.join(os.path.dirname(__file__), "voyager/env/mineflayer/lib/observation/delta.js")
+    envelopes = subprocess.run(["node", delta_js, path], capture_output=True, text=True, check=True).stdout.splitlines()
+
+    # Without deltas the server sends the events as a JSON string inside the JSON body
+    full_payloads = [json.dumps(line.strip()) for line in observations]
+    start_time = time.perf_counter()
+    full_events = [json.loads(json.loads(payload)) for payload in full_payloads]
+    full_decode = time.perf_counter() - start_time
+
+    decoder = ObservationDecoder()
+    start_time = time.perf_counter()
+    delta_events = [decoder.decode(json.loads(envelope)) for envelope in envelopes]
+    delta_decode = time.perf_counter() - start_time
+    if delta_events != full_events:
+        raise RuntimeError(f"Delta observations of {path} do not decode to the recorded ones")
+
+    return {
+        "file": path,
+        "observations": len(observations),
+        "full_bytes": sum(len(payload) for payload in full_payloads),
+        "delta_bytes": sum(len(envelope) for envelope in envelopes),
+        "full_decode_ms": round(full_decode * 1000, 3),
+        "delta_decode_ms": round(delta_decode * 1000, 3),
+    }
+
+
+def benchmark_observations(args):
+    results = [benchmark_observation_log(path) for path in args.files]
+    for result in results:
+        print(f"{os.path.basename(result['file'])}: {result['observations']} observations, "
+              f"{result['full_bytes'] / 1e3:.1f} kB -> {result['delta_bytes'] / 1e3:.1f} kB, "
+              f"decoded in {result['full_decode_ms']:.1f} ms -> {result['delta_decode_ms']:.1f} ms")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    mineflayer_parser = subparsers.add_parser(
+        "mineflayer", help="one mineflayer process per bot vs. a single multiplexed host")
+    mineflayer_parser.add_argument("--bots", type=int, default=6)
+    mineflayer_parser.add_argument("--scenario", default="Mushroom War", choices=list(scenario_classes))
+    mineflayer_parser.add_argument("--mc-port", type=int, default=49172)
+    mineflayer_parser.add_argument("--server-port", type=int, default=3000)
+    mineflayer_parser.set_defaults(run=benchmark_mineflayer)
+
+    step_parser = subparsers.add_parser(
+        "step", help="server-side /step setup with and without compiled program reuse")
+    step_parser.add_argument("--steps", type=int, default=50)
+    step_parser.add_argument("--scenario", default="Mushroom War", choices=list(scenario_classes))
+    step_parser.add_argument("--mc-port", type=int, default=49172)
+    step_parser.add_argument("--server-port", type=int, default=3000)
+    step_parser.set_defaults(run=benchmark_step)
+
+    observations_parser = subparsers.add_parser(
+        "observations", help="full vs. delta-encoded observations of a recorded episode (record_observations=true)")
+    observations_parser.add_argument("files", nargs="+", help="observation logs, one JSON list of events per line")
+    observations_parser.set_defaults(run=benchmark_observations)
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    results = args.run(args)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=4)
+
+
+if __name__ == "__main__":
+    main()
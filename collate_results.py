@@ -81,6 +81,7 @@ def collect_data(logs_dirs, ignore_agents, ignore_scenarios, points_scale_dict):
     ai_invoke_times = []
     ai_input_tokens = []
     ai_output_tokens = []
+    ai_cache_hits = 0
     dedupe_ratios = []
 
     ai_invoke_pattern = re.compile(
@@ -103,7 +104,10 @@ def collect_data(logs_dirs, ignore_agents, ignore_scenarios, points_scale_dict):
                             dedupe_ratios.append(length / initial_length)
                     elif "AI invoke: response time" in line:
                         match = ai_invoke_pattern.search(line)
-                        if match:
+                        # Cached responses took no time and spent no tokens
+                        if ", cache: hit" in line:
+                            ai_cache_hits += 1
+                        elif match:
                             ai_invoke_times.append(float(match.group(1)))
                             ai_input_tokens.append(int(match.group(2)))
                             ai_output_tokens.append(int(match.group(3)))
@@ -200,6 +204,7 @@ def collect_data(logs_dirs, ignore_agents, ignore_scenarios, points_scale_dict):
         "ai_invoke_times": ai_invoke_times,
         "ai_input_tokens": ai_input_tokens,
         "ai_output_tokens": ai_output_tokens,
+        "ai_cache_hits": ai_cache_hits,
         "dedupe_ratios": dedupe_ratios,
     }
 
@@ -586,6 +591,7 @@ def main():
     print(f"Average AI output tokens: {np.mean(data['ai_output_tokens']):.2f}")
     print(f"Total AI input tokens: {np.sum(data['ai_input_tokens'])}")
     print(f"Total AI output tokens: {np.sum(data['ai_output_tokens'])}")
+    print(f"AI responses from cache: {data['ai_cache_hits']}")
     print(f"Average dedupe ratio: {np.mean(data['dedupe_ratios']):.2f}")
     print(f"Average output tokens per second: {np.sum(data['ai_output_tokens']) / np.sum(data['ai_invoke_times']):.2f}")
 
@@ -3,7 +3,7 @@ from abc import ABC
 
 import voyager.utils as U
 from bench.agent_utils import run_threads
-from bench.mc_server.mc_server import ServerProperties
+from bench.mc_server.mc_server import ServerProperties, Bounds
 from bench.pillager_env import PillagerEnv
 from bench.scenario import Scenario
 from pathlib import Path
@@ -43,6 +43,10 @@ class DashAndDine(Scenario, ABC):
             spawn_npcs=False
         )
 
+    @property
+    def arena_bounds(self) -> Bounds:
+        return (-30, -64, -20), (12, -45, 18)
+
     @property
     def description(self) -> str:
         return (
@@ -167,16 +171,16 @@ class DashAndDine(Scenario, ABC):
         ]
 
     def pre_game(self, envs: list[PillagerEnv]):
-        envs[0].step(
-            f"bot.chat('/gamemode creative {envs[0].username}');"
-            + f"bot.chat('/gamemode creative {envs[1].username}');"
-            + f"bot.chat('/gamerule keepInventory true');"
-            + f"bot.chat('/gamerule doDaylightCycle false');"
-            + f"bot.chat('/gamerule randomTickSpeed 200');"
-            + f"bot.chat('/tp {envs[0].username} {self.team_centers[0][0]} {self.team_centers[0][1]} {self.team_centers[0][2]}');"
-            + f"bot.chat('/tp {envs[1].username} {self.team_centers[1][0]} {self.team_centers[1][1]} {self.team_centers[1][2]}');"
-            + f"bot.chat('/gamerule spawnRadius 0');"
-        )
+        self.run_commands(envs[0], [
+            f"gamemode creative {envs[0].username}",
+            f"gamemode creative {envs[1].username}",
+            "gamerule keepInventory true",
+            "gamerule doDaylightCycle false",
+            "gamerule randomTickSpeed 200",
+            f"tp {envs[0].username} {self.team_centers[0][0]} {self.team_centers[0][1]} {self.team_centers[0][2]}",
+            f"tp {envs[1].username} {self.team_centers[1][0]} {self.team_centers[1][1]} {self.team_centers[1][2]}",
+            "gamerule spawnRadius 0",
+        ])
 
     def post_game(self, envs: list[PillagerEnv]):
         pass
@@ -188,11 +192,12 @@ class DashAndDine(Scenario, ABC):
         targets = [envs[i].step for i in range(self.num_judges)]
         args = [[f"await saveRewards(bot, {U.json_dumps(self.team_names[i])}, '{self.log_path}/rewards/"
                  f"{self.team_names[i]}.txt');" + code] for i, code in enumerate(self.team_codes)]
-        run_threads(targets, args=args)
+        run_threads(targets, args=args, shared_kwargs={"observe": []})
 
     def run_server(self, env: PillagerEnv, team_name: str, code: str):
         save_dir = f"{self.log_path}/rewards/{team_name}.txt"
         env.step(
             f"await saveRewards(bot, {U.json_dumps(team_name)}, '{save_dir}');"
-            + code
+            + code,
+            observe=[],
         )
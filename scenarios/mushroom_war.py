@@ -3,7 +3,7 @@ import time
 from abc import ABC
 
 import voyager.utils as U
-from bench.mc_server.mc_server import ServerProperties
+from bench.mc_server.mc_server import ServerProperties, Bounds
 from bench.pillager_env import PillagerEnv
 from bench.scenario import Scenario
 from pathlib import Path
@@ -42,6 +42,10 @@ class MushroomWar(Scenario, ABC):
             spawn_npcs=False
         )
 
+    @property
+    def arena_bounds(self) -> Bounds:
+        return (-26, -64, -28), (8, -45, 24)
+
     def _get_block_positions(self) -> dict[str, list[dict[str, int]]]:
         return {
             "slime_block": [{"x": -9, "y": -60, "z": -7}, {"x": -9, "y": -60, "z": 3}, {"x": -9, "y": -60, "z": -8}, {"x": -9, "y": -60, "z": 4}, {"x": -10, "y": -60, "z": -8}, {"x": -8, "y": -60, "z": -8}, {"x": -10, "y": -60, "z": 4}, {"x": -8, "y": -60, "z": 4}, {"x": -9, "y": -60, "z": -9}, {"x": -9, "y": -60, "z": 5}, {"x": -13, "y": -60, "z": -11}, {"x": -5, "y": -60, "z": -11}, {"x": -13, "y": -60, "z": 7}, {"x": -5, "y": -60, "z": 7}, {"x": -12, "y": -60, "z": -12}, {"x": -6, "y": -60, "z": -12}, {"x": -12, "y": -60, "z": 8}, {"x": -6, "y": -60, "z": 8}, {"x": -13, "y": -60, "z": -12}, {"x": -5, "y": -60, "z": -12}, {"x": -13, "y": -60, "z": 8}, {"x": -5, "y": -60, "z": 8}, {"x": -14, "y": -60, "z": -12}, {"x": -4, "y": -60, "z": -12}, {"x": -14, "y": -60, "z": 8}, {"x": -4, "y": -60, "z": 8}, {"x": -13, "y": -60, "z": -13}, {"x": -5, "y": -60, "z": -13}, {"x": -13, "y": -60, "z": 9}, {"x": -5, "y": -60, "z": 9}],
@@ -134,17 +138,14 @@ class MushroomWar(Scenario, ABC):
 
     def pre_game(self, envs: list[PillagerEnv]):
         env = envs[0]
-        env.step(
-            f"bot.chat('/gamemode spectator {env.username}');"
-            + f"bot.chat('/gamerule keepInventory true');"
-            + f"bot.chat('/gamerule doDaylightCycle false');"
-            + f"bot.chat('/tp {env.username} {self.center_position['x']} {self.center_position['y']} {self.center_position['z']}');"  # move this into a helper?
-            + f"bot.chat('/gamerule randomTickSpeed 3');"
-            + f"bot.chat('/gamerule spawnRadius 0');"
-            # + U.remove_drops_commands()
-            # + U.remove_blocks_commands(self.block_types, self.center_position)
-            # + U.add_block_commands(self.block_positions)
-        )
+        self.run_commands(env, [
+            f"gamemode spectator {env.username}",
+            "gamerule keepInventory true",
+            "gamerule doDaylightCycle false",
+            f"tp {env.username} {self.center_position['x']} {self.center_position['y']} {self.center_position['z']}",
+            "gamerule randomTickSpeed 3",
+            "gamerule spawnRadius 0",
+        ])
 
     def post_game(self, envs: list[PillagerEnv]):
         pass
@@ -156,5 +157,6 @@ class MushroomWar(Scenario, ABC):
         envs[0].step(
             f"await saveRewards(bot, {U.json_dumps(self.team_names[0])}, '{self.log_path}/rewards/{(self.team_names[0])}.txt');"
             + f"await saveRewards(bot, {U.json_dumps(self.team_names[1])}, '{self.log_path}/rewards/{(self.team_names[1])}.txt');"
-            + self.scenario_code
+            + self.scenario_code,
+            observe=[],
         )
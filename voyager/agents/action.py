@@ -220,47 +220,55 @@ class ActionAgent:
         error = None
         while retry > 0:
             try:
-                babel = require("@babel/core")
-                babel_generator = require("@babel/generator").default
-
-                code_pattern = re.compile(r"```(?:javascript|js)(.*?)```", re.DOTALL)
-                code = "\n".join(code_pattern.findall(message.content))
-                parsed = babel.parse(code)
-                functions = []
-                assert len(list(parsed.program.body)) > 0, "No functions found"
-                for i, node in enumerate(parsed.program.body):
-                    if node.type != "FunctionDeclaration":
-                        continue
-                    node_type = (
-                        "AsyncFunctionDeclaration"
-                        if node["async"]
-                        else "FunctionDeclaration"
-                    )
-                    functions.append(
-                        {
-                            "name": node.id.name,
-                            "type": node_type,
-                            "body": babel_generator(node).code,
-                            "params": list(node["params"]),
-                        }
-                    )
-                # find the last async function
-                main_function = None
-                for function in reversed(functions):
-                    if function["type"] == "AsyncFunctionDeclaration":
-                        main_function = function
-                        break
-                assert (
-                    main_function is not None
-                ), "No async function found. Your main function must be async."
-                assert (
-                    len(main_function["params"]) == 1
-                    and main_function["params"][0].name == "bot"
-                ), f"Main function {main_function['name']} must take a single argument named 'bot'"
-                program_code = "\n\n".join(function["body"] for function in functions)
-                # exec_code = f"await {main_function['name']}(bot);"
-
-                exec_code = f"""
+                return self.parse_program(message.content)
+            except Exception as e:
+                retry -= 1
+                error = e
+                time.sleep(1)
+        return f"Error parsing action response (before program execution): {error}"
+
+    def parse_program(self, content: str):
+        babel = require("@babel/core")
+        babel_generator = require("@babel/generator").default
+
+        code_pattern = re.compile(r"```(?:javascript|js)(.*?)```", re.DOTALL)
+        code = "\n".join(code_pattern.findall(content))
+        parsed = babel.parse(code)
+        functions = []
+        assert len(list(parsed.program.body)) > 0, "No functions found"
+        for i, node in enumerate(parsed.program.body):
+            if node.type != "FunctionDeclaration":
+                continue
+            node_type = (
+                "AsyncFunctionDeclaration"
+                if node["async"]
+                else "FunctionDeclaration"
+            )
+            functions.append(
+                {
+                    "name": node.id.name,
+                    "type": node_type,
+                    "body": babel_generator(node).code,
+                    "params": list(node["params"]),
+                }
+            )
+        # find the last async function
+        main_function = None
+        for function in reversed(functions):
+            if function["type"] == "AsyncFunctionDeclaration":
+                main_function = function
+                break
+        assert (
+            main_function is not None
+        ), "No async function found. Your main function must be async."
+        assert (
+            len(main_function["params"]) == 1
+            and main_function["params"][0].name == "bot"
+        ), f"Main function {main_function['name']} must take a single argument named 'bot'"
+        program_code = "\n\n".join(function["body"] for function in functions)
+        # exec_code = f"await {main_function['name']}(bot);"
+
+        exec_code = f"""
 const result = await Promise.race([
     {main_function['name']}(bot),
     new Promise(resolve => setTimeout(() => resolve('Timeout reached'), {self.episode_timeout * 1000}))
@@ -269,16 +277,44 @@ const result = await Promise.race([
 if (result === 'Timeout reached') {{
     bot.chat('[episode timeout]');
 }}"""
-                return {
-                    "program_code": program_code,
-                    "program_name": main_function["name"],
-                    "exec_code": exec_code,
-                }
-            except Exception as e:
-                retry -= 1
-                error = e
-                time.sleep(1)
-        return f"Error parsing action response (before program execution): {error}"
+        return {
+            "program_code": program_code,
+            "program_name": main_function["name"],
+            "exec_code": exec_code,
+        }
+
+    def partial_program_parser(self):
+        """
+        Returns a function that parses the content of a response that is still streaming, see StreamedResponse. It
+        returns the program once the last closed code block defines the main function that parse_program selects, and
+        None before that. Responses that spread the program over several blocks put the main function last, so the
+        program is the same as the one parsed from the complete response.
+        """
+        code_pattern = re.compile(r"```(?:javascript|js)(.*?)```", re.DOTALL)
+        # Fences start a line, so backticks inside strings and comments are not taken for one
+        fence_pattern = re.compile(r"^[ \t]*```", re.MULTILINE)
+        last_code = None
+
+        def parse(content: str):
+            nonlocal last_code
+            # Only parse when all code blocks are closed and one was added since the last attempt
+            if len(fence_pattern.findall(content)) % 2 != 0:
+                return None
+            blocks = code_pattern.findall(content)
+            code = "\n".join(blocks)
+            if not code or code == last_code:
+                return None
+            last_code = code
+            try:
+                program = self.parse_program(content)
+            except Exception:
+                return None
+            main_function = re.compile(rf"\basync\s+function\s+{re.escape(program['program_name'])}\s*\(")
+            if not main_function.search(blocks[-1]):
+                return None
+            return program
+
+        return parse
 
     def summarize_chatlog(self, events):
         def filter_item(message: str):
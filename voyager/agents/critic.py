@@ -144,7 +144,7 @@ class CriticAgent:
             confirmed = input("Confirm? (y/n)") in ["y", ""]
         return success, critique
 
-    def ai_check_task_success(self, messages, max_retries=5):
+    def ai_check_task_success(self, messages, max_retries=5, attempt=0):
         if max_retries == 0:
             self.logger(
                 "\033[31mFailed to parse Critic Agent response. Consider updating your prompt.\033[0m"
@@ -154,7 +154,7 @@ class CriticAgent:
         if messages[1] is None:
             return False, ""
 
-        critic = invoke_with_log(self.llm, messages, prefix="Critic ").content
+        critic = invoke_with_log(self.llm, messages, prefix="Critic ", attempt=attempt).content
         self.logger(f"\033[31m****Critic Agent ai message****\n{critic}\033[0m")
         try:
             response = fix_and_parse_json(critic)
@@ -167,6 +167,7 @@ class CriticAgent:
             return self.ai_check_task_success(
                 messages=messages,
                 max_retries=max_retries - 1,
+                attempt=attempt + 1,
             )
 
     def check_task_success(
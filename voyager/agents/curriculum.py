@@ -284,10 +284,10 @@ class CurriculumAgent:
         else:
             raise ValueError(f"Invalid curriculum agent mode: {self.mode}")
 
-    def propose_next_ai_task(self, *, messages, max_retries=5):
+    def propose_next_ai_task(self, *, messages, max_retries=5, attempt=0):
         if max_retries == 0:
             raise RuntimeError("Max retries reached, failed to propose ai task.")
-        curriculum = invoke_with_log(self.llm, messages, prefix="Curriculum ").content
+        curriculum = invoke_with_log(self.llm, messages, prefix="Curriculum ", attempt=attempt).content
         self.logger(f"\033[31m****Curriculum Agent ai message****\n{curriculum}\033[0m")
         try:
             response = self.parse_ai_message(curriculum)
@@ -301,6 +301,7 @@ class CurriculumAgent:
             return self.propose_next_ai_task(
                 messages=messages,
                 max_retries=max_retries - 1,
+                attempt=attempt + 1,
             )
 
     def parse_ai_message(self, message):
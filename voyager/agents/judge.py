@@ -141,7 +141,7 @@ class JudgeAgent:
     #         confirmed = input("Confirm? (y/n)") in ["y", ""]
     #     return success, critique
 
-    def ai_check_task_success(self, messages, max_retries=5):
+    def ai_check_task_success(self, messages, max_retries=5, attempt=0):
         if max_retries == 0:
             self.logger(
                 "\033[31mFailed to parse Judge Agent response. Consider updating your prompt.\033[0m"
@@ -151,7 +151,7 @@ class JudgeAgent:
         if messages[1] is None:
             return False, ""
 
-        critic = invoke_with_log(self.llm, messages, prefix="Judge ").content
+        critic = invoke_with_log(self.llm, messages, prefix="Judge ", attempt=attempt).content
         self.logger(f"\033[31m****Judge Agent ai message****\n{critic}\033[0m")
 
         # fix this 
@@ -180,4 +180,5 @@ class JudgeAgent:
             return self.ai_check_task_success(
                 messages=messages,
                 max_retries=max_retries - 1,
+                attempt=attempt + 1,
             )
\ No newline at end of file
@@ -1 +1,2 @@
 from .bridge import VoyagerEnv
+from .mineflayer_pool import MineflayerPool, MineflayerHost
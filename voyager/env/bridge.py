@@ -1,10 +1,15 @@
+import asyncio
+import hashlib
 import logging
 import os.path
 import time
+import uuid
 import warnings
-from typing import SupportsFloat, Any, Tuple, Dict
+from typing import SupportsFloat, Any, Tuple, Dict, Optional
 
+import httpx
 import requests
+from requests.adapters import HTTPAdapter
 import json
 
 import gymnasium as gym
@@ -12,11 +17,20 @@ from gymnasium.core import ObsType
 
 import voyager.utils as U
 
+from .latency import LatencyHistogram
 from .minecraft_launcher import MinecraftInstance
+from .mineflayer_pool import MineflayerPool
+from .obs_delta import ObservationDecoder
 from .process_monitor import SubprocessMonitor
 
 logger = logging.getLogger(__name__)
 
+JSON_HEADERS = {"Content-Type": "application/json"}
+
+
+def hash_programs(programs: str) -> str:
+    return hashlib.sha256(programs.encode("utf-8")).hexdigest()
+
 
 class VoyagerEnv(gym.Env):
     def __init__(
@@ -27,9 +41,20 @@ class VoyagerEnv(gym.Env):
         server_host="http://127.0.0.1",
         server_port=3000,
         request_timeout=10,
+        connect_timeout=2,
+        start_timeout=10,
+        ready_timeout=60,
+        pool_maxsize=2,
         polling_timeout=600,
         polling_interval=1,
         log_path="./logs",
+        start_backoff=0.25,
+        long_poll_wait=20,
+        program_cache=True,
+        compile_cache=True,
+        delta_observations=False,
+        observation_log: Optional[str] = None,
+        mineflayer_pool: Optional[MineflayerPool] = None,
     ):
         if not mc_port and not azure_login:
             raise ValueError("Either mc_port or azure_login must be specified")
@@ -41,12 +66,52 @@ class VoyagerEnv(gym.Env):
         self.username = username
         self.azure_login = azure_login
         self.server = f"{server_host}:{server_port}"
+        if mineflayer_pool is not None:
+            self.server = mineflayer_pool.server_url(server_port, username)
         self.server_port = server_port
         self.request_timeout = request_timeout
+        self.connect_timeout = connect_timeout
+        self.start_timeout = start_timeout
+        # How long node may take to start listening before it is restarted
+        self.ready_timeout = ready_timeout
+        # Keep-alive connections to the mineflayer server, reused by all requests of this env
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        # The async client is bound to the event loop it was created in, so it is created on first use
+        self.pool_maxsize = pool_maxsize
+        self.async_client: Optional[httpx.AsyncClient] = None
+        self.async_client_loop: Optional[asyncio.AbstractEventLoop] = None
+        # Round-trip time of the requests per endpoint, to tell the HTTP overhead apart from game time
+        self.latency: dict[str, LatencyHistogram] = {}
         self.polling_timeout = polling_timeout
         self.polling_interval = polling_interval
+        self.start_backoff = start_backoff
+        self.long_poll_wait = long_poll_wait
+        # Hashes of the program texts the mineflayer server already has, which are then sent by hash only
+        self.program_cache = program_cache
+        self.known_programs: set[str] = set()
+        # Whether the mineflayer server may reuse the programs it compiled for earlier steps
+        self.compile_cache = compile_cache
+        self.step_stats = {
+            "steps": 0, "bytes_sent": 0, "program_uploads": 0, "server_parse_ms": 0.0, "server_setup_ms": 0.0,
+            "waited_ticks": 0, "observation_bytes": 0, "observation_decode_ms": 0.0, "cancelled_steps": 0,
+            "step_reattaches": 0, "step_retries": 0,
+        }
+        # Observations only carry what changed since the last one, which the decoder fills in
+        self.delta_observations = delta_observations
+        self.obs_decoder = ObservationDecoder()
+        # Appends every observation to this JSON lines file, e.g. to replay it in benchmark_env.py
+        self.observation_log = observation_log
         self.log_path = log_path
-        self.mineflayer = self.get_mineflayer_process(server_port)
+        # How long the last reset spent stopping node and connecting the bot, as reported by the mineflayer server
+        self.reset_timings: dict[str, float] = {}
+        self.mineflayer_pool = mineflayer_pool
+        if mineflayer_pool is not None:
+            self.mineflayer = mineflayer_pool.get_worker(server_port, username, log_path)
+        else:
+            self.mineflayer = self.get_mineflayer_process(server_port)
         if azure_login:
             self.mc_instance = self.get_mc_instance()
         else:
@@ -80,22 +145,7 @@ class VoyagerEnv(gym.Env):
         )
 
     def restart_mineflayer(self):
-        if self.mc_instance and not self.mc_instance.is_running:
-            # if self.mc_instance:
-            #     self.mc_instance.check_process()
-            #     if not self.mc_instance.is_running:
-            print("Starting Minecraft server")
-            self.mc_instance.run()
-            self.mc_port = self.mc_instance.port
-            self.reset_options["port"] = self.mc_instance.port
-            print(f"Server started on port {self.reset_options['port']}")
-        retry = 0
-        while not self.mineflayer.is_running and retry <= 10:
-            retry += 1
-            print("Mineflayer process has exited, restarting")
-            self.mineflayer.run()
-            if not self.mineflayer.is_running:
-                continue
+        self.ensure_processes()
 
         for retry in range(10):
             # janky wait to make sure process has started
@@ -103,104 +153,368 @@ class VoyagerEnv(gym.Env):
                 # Maybe mineflayer is not running in subsequent tries
                 if not self.mineflayer.is_running:
                     print("Mineflayer process has exited, restarting")
-                    self.mineflayer.run()
-
-                res = requests.post(
-                    f"{self.server}/start",
-                    json=self.reset_options,
-                    timeout=10, #self.request_timeout,
-                )
-                if res.status_code != 200:
-                    self.mineflayer.stop()
-                    raise RuntimeError(
-                        f"Minecraft server reply with code {res.status_code}"
-                    )
-            except:
-                print('bot start failed, retrying...')
+                    self.run_mineflayer()
+
+                start_time = time.time()
+                res = self.request("post", "/start", json=self.reset_options, read_timeout=self.start_timeout)
+                self.check_start_response(res)
+            except Exception as e:
+                time.sleep(self.start_retry_delay(retry, e))
                 continue
-            print(self.mineflayer.ready_line)
-            return res.json()
+            return self.finish_start(res, start_time, retry)
 
-    def check_process(self):
+    async def arestart_mineflayer(self):
+        # Starting processes blocks until they are ready, so it happens in a worker thread
+        await asyncio.to_thread(self.ensure_processes)
+
+        for retry in range(10):
+            try:
+                if not self.mineflayer.is_running:
+                    print("Mineflayer process has exited, restarting")
+                    await asyncio.to_thread(self.run_mineflayer)
+
+                start_time = time.time()
+                res = await self.arequest("post", "/start", json=self.reset_options, read_timeout=self.start_timeout)
+                self.check_start_response(res)
+            except Exception as e:
+                await asyncio.sleep(self.start_retry_delay(retry, e))
+                continue
+            return self.finish_start(res, start_time, retry)
+
+    def ensure_minecraft(self):
         if self.mc_instance and not self.mc_instance.is_running:
-            # if self.mc_instance:
-            #     self.mc_instance.check_process()
-            #     if not self.mc_instance.is_running:
             print("Starting Minecraft server")
             self.mc_instance.run()
             self.mc_port = self.mc_instance.port
             self.reset_options["port"] = self.mc_instance.port
             print(f"Server started on port {self.reset_options['port']}")
+
+    def ensure_processes(self):
+        self.ensure_minecraft()
+        retry = 0
+        while not self.mineflayer.is_running and retry <= 10:
+            retry += 1
+            print("Mineflayer process has exited, restarting")
+            self.run_mineflayer()
+
+    def check_start_response(self, res):
+        if res.status_code != 200:
+            # A shared worker also serves other bots, so leave its replacement to the pool
+            if self.mineflayer_pool is None:
+                self.mineflayer.stop()
+            raise RuntimeError(
+                f"Minecraft server reply with code {res.status_code}"
+            )
+
+    def start_retry_delay(self, retry: int, error: Exception) -> float:
+        # Back off so that a server that is still starting or a port that is still in use can recover
+        delay = min(self.start_backoff * 2 ** retry, 5)
+        print(f'bot start failed ({error}), retrying in {delay:.2f}s...')
+        return delay
+
+    def finish_start(self, res, start_time: float, retry: int):
+        self.reset_timings.update({
+            "start": time.time() - start_time,
+            "login": float(res.headers.get("X-Login-Ms", 0)) / 1000,
+            "spawn": float(res.headers.get("X-Spawn-Ms", 0)) / 1000,
+            "ready": float(res.headers.get("X-Ready-Ms", 0)) / 1000,
+            "start_attempts": retry + 1,
+        })
+        print(self.mineflayer.ready_line)
+        return self.decode_observation(res)
+
+    def request(self, method: str, endpoint: str, read_timeout: Optional[float] = None,
+                latency_key: Optional[str] = None, **kwargs) -> requests.Response:
+        """
+        Sends a request to the mineflayer server over the keep-alive session and records its round-trip time.
+        """
+        start_time = time.time()
+        try:
+            return self.session.request(
+                method,
+                f"{self.server}{endpoint}",
+                timeout=(self.connect_timeout, read_timeout or self.request_timeout),
+                **kwargs,
+            )
+        finally:
+            self.record_latency(latency_key or endpoint, start_time)
+
+    async def arequest(self, method: str, endpoint: str, read_timeout: Optional[float] = None,
+                       latency_key: Optional[str] = None, **kwargs) -> httpx.Response:
+        """
+        Async counterpart of request on the env's httpx client.
+        """
+        start_time = time.time()
+        try:
+            return await self.get_async_client().request(
+                method,
+                f"{self.server}{endpoint}",
+                timeout=httpx.Timeout(read_timeout or self.request_timeout, connect=self.connect_timeout),
+                **kwargs,
+            )
+        finally:
+            self.record_latency(latency_key or endpoint, start_time)
+
+    def get_async_client(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if self.async_client is not None and self.async_client_loop is not loop:
+            # The connections of the client belong to the loop it was created on. Close them there while it runs,
+            # a stopped loop can no longer close them and they are released with the client.
+            if self.async_client_loop.is_running():
+                asyncio.run_coroutine_threadsafe(self.async_client.aclose(), self.async_client_loop)
+            self.async_client = None
+        if self.async_client is None:
+            self.async_client = httpx.AsyncClient(limits=httpx.Limits(
+                max_connections=self.pool_maxsize,
+                max_keepalive_connections=self.pool_maxsize,
+            ))
+            self.async_client_loop = loop
+        return self.async_client
+
+    def record_latency(self, key: str, start_time: float):
+        self.latency.setdefault(key, LatencyHistogram()).add(time.time() - start_time)
+
+    def run_mineflayer(self):
+        if self.mineflayer_pool is not None:
+            # The pool serializes restarts of workers that are shared between environments
+            self.mineflayer = self.mineflayer_pool.ensure_worker(self.server_port)
+        else:
+            self.mineflayer.run(timeout=self.ready_timeout)
+
+    def check_process(self):
+        self.ensure_minecraft()
         retry = 0
         while not self.mineflayer.is_running and retry <= 10:
             retry += 1
             print("Mineflayer process has exited, restarting")
-            self.mineflayer.run()
+            self.run_mineflayer()
 
             try:
-                res = requests.post(
-                    f"{self.server}/start",
-                    json=self.reset_options,
-                    timeout=10, #self.request_timeout,
-                )
-                if res.status_code != 200:
-                    self.mineflayer.stop()
-                    raise RuntimeError(
-                        f"Minecraft server reply with code {res.status_code}"
-                    )
-            except:
+                res = self.request("post", "/start", json=self.reset_options, read_timeout=self.start_timeout)
+                self.check_start_response(res)
+            except Exception:
                 print('bot start failed, retrying...')
                 continue
             print(self.mineflayer.ready_line)
-            return res.json()
+            return self.decode_observation(res)
 
     def step(
         self,
         code: str,
         programs: str = "",
+        observe: Optional[list[str]] = None,
+        step_id: Optional[str] = None,
     ) -> Tuple[ObsType, SupportsFloat, bool, bool, Dict[str, Any]]:
         if not self.has_reset:
             raise RuntimeError("Environment has not been reset yet")
         self.check_process()
         # self.unpause()
-        data = {
-            "code": code,
-            "programs": programs,
-        }
+        step_id = step_id or uuid.uuid4().hex
+        body, uploaded = self.encode_step(code, programs, observe=observe, step_id=step_id)
+        res = self.request("post", "/step", data=body, headers=JSON_HEADERS)
+        if self.is_unknown_programs(res):
+            body, uploaded = self.encode_step(code, programs, upload=True, observe=observe, step_id=step_id)
+            res = self.request("post", "/step", data=body, headers=JSON_HEADERS)
+        self.record_step(res, body, uploaded, programs)
+        observation = self.parse_step_response(res)
+        if observation is None:
+            logger.debug("Step is executing. Polling for status...")
+            observation = self.poll_for_status(step_id)
+        self.record_wait(observation)
+        return observation
 
-        res = requests.post(f"{self.server}/step", json=data, timeout=self.request_timeout)
+    def reattach(self, step_id: str):
+        """
+        Waits for a step the server has already accepted, e.g. after polling failed, and returns its observation.
+        Returns None if the server does not know the step, in which case it has to be run again.
+        """
+        if not self.mineflayer.is_running:
+            return None
+        try:
+            res = self.request("get", "/status", **self.status_request_kwargs(step_id))
+        except requests.RequestException:
+            return None
+        if res.status_code not in (200, 202):
+            return None
+        logger.info(f"Reattached to step {step_id}")
+        self.step_stats["step_reattaches"] += 1
+        observation = self.parse_step_response(res)
+        if observation is None:
+            observation = self.poll_for_status(step_id)
+        self.record_wait(observation)
+        return observation
 
+    async def astep(
+        self,
+        code: str,
+        programs: str = "",
+        observe: Optional[list[str]] = None,
+        step_id: Optional[str] = None,
+    ) -> Tuple[ObsType, SupportsFloat, bool, bool, Dict[str, Any]]:
+        if not self.has_reset:
+            raise RuntimeError("Environment has not been reset yet")
+        await asyncio.to_thread(self.check_process)
+        step_id = step_id or uuid.uuid4().hex
+        body, uploaded = self.encode_step(code, programs, observe=observe, step_id=step_id)
+        res = await self.arequest("post", "/step", content=body, headers=JSON_HEADERS)
+        if self.is_unknown_programs(res):
+            body, uploaded = self.encode_step(code, programs, upload=True, observe=observe, step_id=step_id)
+            res = await self.arequest("post", "/step", content=body, headers=JSON_HEADERS)
+        self.record_step(res, body, uploaded, programs)
+        observation = self.parse_step_response(res)
+        if observation is None:
+            logger.debug("Step is executing. Polling for status...")
+            observation = await self.apoll_for_status(step_id)
+        self.record_wait(observation)
+        return observation
+
+    async def areattach(self, step_id: str):
+        if not self.mineflayer.is_running:
+            return None
+        try:
+            res = await self.arequest("get", "/status", **self.status_request_kwargs(step_id))
+        except httpx.HTTPError:
+            return None
+        if res.status_code not in (200, 202):
+            return None
+        logger.info(f"Reattached to step {step_id}")
+        self.step_stats["step_reattaches"] += 1
+        observation = self.parse_step_response(res)
+        if observation is None:
+            observation = await self.apoll_for_status(step_id)
+        self.record_wait(observation)
+        return observation
+
+    def encode_step(self, code: str, programs: str, upload: bool = False,
+                    observe: Optional[list[str]] = None, step_id: Optional[str] = None) -> Tuple[bytes, bool]:
+        """
+        Returns the /step request body and whether it includes the program text.
+        observe lists the observations to compute, e.g. ["voxels", "status"], None computes all of them.
+        The server runs a step only once per step_id, resending it attaches to the step instead.
+        """
+        data = {"code": code}
+        if step_id is not None:
+            data["stepId"] = step_id
+        if observe is not None:
+            data["observe"] = observe
+        if not self.compile_cache:
+            data["compileCache"] = False
+        if not self.program_cache:
+            data["programs"] = programs
+        else:
+            data["programsHash"] = hash_programs(programs)
+            if upload or data["programsHash"] not in self.known_programs:
+                data["programs"] = programs
+        return json.dumps(data).encode("utf-8"), "programs" in data
+
+    def is_unknown_programs(self, res) -> bool:
+        # The server forgot the programs, e.g. because the worker was restarted
+        if self.program_cache and res.status_code == 409:
+            self.known_programs.clear()
+            return True
+        return False
+
+    def record_step(self, res, body: bytes, uploaded: bool, programs: str):
+        if self.program_cache and res.status_code in (200, 202):
+            self.known_programs.add(hash_programs(programs))
+        self.step_stats["steps"] += 1
+        if res.headers.get("X-Step-Reattached"):
+            self.step_stats["step_reattaches"] += 1
+        self.step_stats["bytes_sent"] += len(body)
+        self.step_stats["server_parse_ms"] += float(res.headers.get("X-Parse-Ms", 0))
+        self.step_stats["server_setup_ms"] += float(res.headers.get("X-Setup-Ms", 0))
+        if uploaded:
+            self.step_stats["program_uploads"] += 1
+
+    def record_wait(self, observation):
+        # The final observe event reports how long the server waited for the events to settle after the code
+        if observation and observation[-1][0] == "observe":
+            self.step_stats["waited_ticks"] += observation[-1][1].get("status", {}).get("waitedTicks") or 0
+
+    def parse_step_response(self, res):
+        """
+        Returns the observation of a finished step, or None if the step is still executing.
+        """
         if res.status_code == 200:
-            return json.loads(res.json())
+            return self.decode_observation(res)
         elif res.status_code == 400:
             raise RuntimeError(f"Error in request: {res.json()}")
         elif res.status_code == 202:
-            logger.debug("Step is executing. Polling for status...")
-            return self.poll_for_status()
+            return None
         else:
             raise RuntimeError(f"Minecraft server replied with code {res.status_code}")
 
-    def poll_for_status(self):
+    def poll_for_status(self, step_id: Optional[str] = None):
         start_time = time.time()
         while True:
             try:
-                # Polling endpoint (adjust the endpoint as needed)
-                res = requests.get(f"{self.server}/status", timeout=self.request_timeout)
-                if res.status_code == 200:
-                    logger.debug("Step completed.")
-                    return json.loads(res.json())
-                elif res.status_code == 400:
-                    raise RuntimeError(f"Error in request: {res.json()}")
-                elif res.status_code != 202:
-                    raise RuntimeError(f"Unexpected server response: {res.status_code}")
+                res = self.request("get", "/status", **self.status_request_kwargs(step_id))
             except requests.RequestException as e:
                 raise RuntimeError(f"Error polling server: {e}")
+            observation = self.parse_step_response(res)
+            if observation is not None:
+                logger.debug("Step completed.")
+                return observation
 
             # Check for timeout
             if time.time() - start_time > self.polling_timeout:
                 raise RuntimeError("Polling timed out.")
 
-            time.sleep(self.polling_interval)
+            if self.needs_polling_interval(res):
+                time.sleep(self.polling_interval)
+
+    async def apoll_for_status(self, step_id: Optional[str] = None):
+        start_time = time.time()
+        while True:
+            try:
+                res = await self.arequest("get", "/status", **self.status_request_kwargs(step_id))
+            except httpx.HTTPError as e:
+                raise RuntimeError(f"Error polling server: {e}")
+            observation = self.parse_step_response(res)
+            if observation is not None:
+                logger.debug("Step completed.")
+                return observation
+
+            if time.time() - start_time > self.polling_timeout:
+                raise RuntimeError("Polling timed out.")
+
+            if self.needs_polling_interval(res):
+                await asyncio.sleep(self.polling_interval)
+
+    def decode_observation(self, res):
+        start_time = time.time()
+        if self.delta_observations:
+            observation = self.obs_decoder.decode(res.json())
+        else:
+            observation = json.loads(res.json())
+        self.step_stats["observation_decode_ms"] += (time.time() - start_time) * 1000
+        self.step_stats["observation_bytes"] += len(res.content)
+        if self.observation_log is not None:
+            with open(self.observation_log, "a") as f:
+                f.write(json.dumps(observation) + "\n")
+        return observation
+
+    def status_request_kwargs(self, step_id: Optional[str] = None) -> dict:
+        # With a step ID the server answers 404 instead of the status of another step, e.g. after a restart
+        params = {} if step_id is None else {"stepId": step_id}
+        if self.delta_observations:
+            params["delta"] = 1
+            if self.obs_decoder.seq is not None:
+                params["ack"] = self.obs_decoder.seq
+        # Servers that support long polling hold the request until the step has finished.
+        # Long polls include the game time, so they are recorded apart from the plain status requests.
+        if self.long_poll_wait <= 0:
+            return {"params": params}
+        params["wait"] = self.long_poll_wait
+        return {
+            "params": params,
+            "read_timeout": self.request_timeout + self.long_poll_wait,
+            "latency_key": "/status?wait",
+        }
+
+    def needs_polling_interval(self, res) -> bool:
+        # Fall back to interval polling for servers without long polling
+        return self.long_poll_wait <= 0 or "X-Long-Poll" not in res.headers
 
     def render(self):
         raise NotImplementedError("render is not implemented")
@@ -211,6 +525,22 @@ class VoyagerEnv(gym.Env):
         seed=None,
         options=None,
     ) -> list[tuple[str, dict[str, any]]]:
+        self.prepare_reset(options)
+        returned_data = self.restart_mineflayer()
+        return self.finish_reset(returned_data)
+
+    async def areset(
+        self,
+        *,
+        seed=None,
+        options=None,
+    ) -> list[tuple[str, dict[str, any]]]:
+        # Stopping node blocks until it has exited
+        await asyncio.to_thread(self.prepare_reset, options)
+        returned_data = await self.arestart_mineflayer()
+        return self.finish_reset(returned_data)
+
+    def prepare_reset(self, options: Optional[dict]):
         if options is None:
             options = {}
 
@@ -225,43 +555,88 @@ class VoyagerEnv(gym.Env):
             "equipment": options.get("equipment", []),
             "spread": options.get("spread", False),
             "waitTicks": options.get("wait_ticks", 5),
+            # End the wait after a step early once no events arrived for this many ticks, 0 always waits waitTicks
+            "quietTicks": options.get("quiet_ticks", 0),
             "position": options.get("position", None),
+            # Pooled workers may keep the bot connected if the username and port are unchanged
+            "reuse": self.mineflayer_pool is not None,
+            "delta": self.delta_observations,
         }
 
         # self.unpause()
-        self.mineflayer.stop()
-        time.sleep(1)  # wait for mineflayer to exit
+        self.reset_timings = {}
+        start_time = time.time()
+        if self.mineflayer_pool is not None:
+            self.mineflayer = self.mineflayer_pool.ensure_worker(self.server_port)
+        else:
+            # Returns once node has exited and released its port
+            self.mineflayer.stop()
+        self.reset_timings["stop"] = time.time() - start_time
 
-        returned_data = self.restart_mineflayer()
+    def finish_reset(self, returned_data) -> list[tuple[str, dict[str, any]]]:
         self.has_reset = True
         self.connected = True
         # All the reset in step will be soft
         self.reset_options["reset"] = "soft"
         # self.pause()
-        return json.loads(returned_data) if returned_data else []
+        return returned_data if returned_data else []
 
     def close(self):
         logger.info('close')
         # self.unpause()
         if self.connected:
-            res = requests.post(f"{self.server}/stop")
+            res = self.request("post", "/stop")
+            if res.status_code == 200:
+                self.connected = False
+        self.stop_processes()
+        self.session.close()
+        return not self.connected
+
+    async def aclose(self):
+        logger.info('close')
+        if self.connected:
+            res = await self.arequest("post", "/stop")
             if res.status_code == 200:
                 self.connected = False
+        await asyncio.to_thread(self.stop_processes)
+        if self.async_client is not None:
+            await self.async_client.aclose()
+            self.async_client = None
+        return not self.connected
+
+    def cancel(self) -> list:
+        """
+        Stops the running step, if any, so that its step call returns right away, and returns the observation.
+        The code of the step cannot be interrupted, but the bot stops moving, fighting and digging.
+        """
+        if not self.connected or not self.mineflayer.is_running:
+            return []
+        res = self.request("post", "/cancel")
+        if res.status_code != 200:
+            raise RuntimeError(f"Minecraft server replied with code {res.status_code}")
+        if res.headers.get("X-Cancelled") == "true":
+            self.step_stats["cancelled_steps"] += 1
+        # Not delta encoded, the observation also goes to the pending step
+        return json.loads(res.json())
+
+    def stop_processes(self):
         if self.mc_instance:
             self.mc_instance.stop()
-        self.mineflayer.stop()
-        return not self.connected
+        # Pooled workers stay resident for the next episode
+        if self.mineflayer_pool is None:
+            self.mineflayer.stop()
+            self.mineflayer.close_log()
 
     def pause(self):
         if self.mineflayer.is_running and not self.server_paused:
-            res = requests.post(f"{self.server}/pause")
+            res = self.request("post", "/pause")
             if res.status_code == 200:
                 self.server_paused = True
         return self.server_paused
 
     def unpause(self):
         if self.mineflayer.is_running and self.server_paused:
-            res = requests.post(f"{self.server}/pause")
+            res = self.request("post", "/pause")
             if res.status_code == 200:
                 self.server_paused = False
             else:
@@ -0,0 +1,53 @@
+import bisect
+import threading
+from typing import Iterable
+
+# Upper bucket bounds in milliseconds, the last bucket collects everything slower
+LATENCY_BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000]
+
+
+class LatencyHistogram:
+    """
+    Counts request latencies in fixed log-scale buckets.
+    """
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.lock = threading.Lock()
+
+    def add(self, seconds: float):
+        with self.lock:
+            self.counts[bisect.bisect_left(LATENCY_BUCKETS_MS, seconds * 1000)] += 1
+            self.count += 1
+            self.total += seconds
+            self.max = max(self.max, seconds)
+
+    def merge(self, other: "LatencyHistogram"):
+        with self.lock:
+            self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+            self.count += other.count
+            self.total += other.total
+            self.max = max(self.max, other.max)
+
+    def to_dict(self) -> dict:
+        labels = [f"<={bound}ms" for bound in LATENCY_BUCKETS_MS] + [f">{LATENCY_BUCKETS_MS[-1]}ms"]
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total / self.count * 1000, 2) if self.count else 0,
+            "max_ms": round(self.max * 1000, 2),
+            "buckets": {label: count for label, count in zip(labels, self.counts) if count},
+        }
+
+
+def merge_histograms(histograms: Iterable[dict[str, LatencyHistogram]]) -> dict[str, dict]:
+    """
+    Merges per-endpoint histograms of several clients and returns them as plain dicts.
+    """
+    merged: dict[str, LatencyHistogram] = {}
+    for client_histograms in histograms:
+        for endpoint, histogram in client_histograms.items():
+            merged.setdefault(endpoint, LatencyHistogram()).merge(histogram)
+    return {endpoint: histogram.to_dict() for endpoint, histogram in sorted(merged.items())}
@@ -1,4 +1,6 @@
 const fs = require("fs");
+const vm = require("vm");
+const crypto = require("crypto");
 const express = require("express");
 const bodyParser = require("body-parser");
 const mineflayer = require("mineflayer");
@@ -13,54 +15,255 @@ const Status = require("./lib/observation/status");
 const Inventory = require("./lib/observation/inventory");
 const OnSave = require("./lib/observation/onSave");
 const Chests = require("./lib/observation/chests");
+const { createDeltaState, encodeDelta } = require("./lib/observation/delta");
 const { plugin: tool } = require("mineflayer-tool");
-
-let bot = null;
+const {
+    Movements,
+    goals: {
+        Goal,
+        GoalBlock,
+        GoalNear,
+        GoalXZ,
+        GoalNearXZ,
+        GoalY,
+        GoalGetToBlock,
+        GoalLookAtBlock,
+        GoalBreakBlock,
+        GoalCompositeAny,
+        GoalCompositeAll,
+        GoalInvert,
+        GoalFollow,
+        GoalPlaceBlock,
+    },
+    pathfinder,
+    Move,
+    ComputedPath,
+    PartiallyComputedPath,
+    XZCoordinates,
+    XYZCoordinates,
+    SafeBlock,
+    GoalPlaceBlockOptions,
+} = require("mineflayer-pathfinder");
+const { Vec3 } = require("vec3");
 
 const app = express();
 
+// Upper bound for how long a /status request may wait for a step to finish
+const MAX_LONG_POLL_SECONDS = 30;
+
+// Program texts by hash, shared by all bots of the process. Clients upload a text once and refer to its hash after.
+const programStore = new Map();
+const MAX_STORED_PROGRAMS = 64;
+
+function storeProgram(hash, programs) {
+    programStore.delete(hash);
+    programStore.set(hash, programs);
+    // Maps iterate in insertion order, so the first key is the least recently stored one
+    while (programStore.size > MAX_STORED_PROGRAMS) {
+        programStore.delete(programStore.keys().next().value);
+    }
+}
+
+// Result of a step that was cancelled before its code finished
+const STEP_CANCELLED = Symbol("cancelled");
+
+// Compiled programs per bot, keyed by the hash of their text
+const MAX_PROGRAM_EXECUTORS = 16;
+
+// Names the programs and the step code can use besides `bot` and `mcData`, as they could when they were evaluated inside /step
+const PROGRAM_SCOPE = {
+    require,
+    fs,
+    mineflayer,
+    Vec3,
+    Movements,
+    Goal,
+    GoalBlock,
+    GoalNear,
+    GoalXZ,
+    GoalNearXZ,
+    GoalY,
+    GoalGetToBlock,
+    GoalLookAtBlock,
+    GoalBreakBlock,
+    GoalCompositeAny,
+    GoalCompositeAll,
+    GoalInvert,
+    GoalFollow,
+    GoalPlaceBlock,
+    pathfinder,
+    Move,
+    ComputedPath,
+    PartiallyComputedPath,
+    XZCoordinates,
+    XYZCoordinates,
+    SafeBlock,
+    GoalPlaceBlockOptions,
+};
+
+const FAIL_COUNTS = [
+    "_craftItemFailCount",
+    "_killMobFailCount",
+    "_mineBlockFailCount",
+    "_placeItemFailCount",
+    "_smeltItemFailCount",
+    "_farmFailCount",
+];
+
+function hashPrograms(programs) {
+    return crypto.createHash("sha256").update(programs).digest("hex");
+}
+
+function loadMcData(version) {
+    const mcData = require("minecraft-data")(version);
+    mcData.itemsByName["leather_cap"] = mcData.itemsByName["leather_helmet"];
+    mcData.itemsByName["leather_tunic"] =
+        mcData.itemsByName["leather_chestplate"];
+    mcData.itemsByName["leather_pants"] =
+        mcData.itemsByName["leather_leggings"];
+    mcData.itemsByName["leather_boots"] = mcData.itemsByName["leather_boots"];
+    mcData.itemsByName["lapis_lazuli_ore"] = mcData.itemsByName["lapis_ore"];
+    mcData.blocksByName["lapis_lazuli_ore"] = mcData.blocksByName["lapis_ore"];
+    return mcData;
+}
+
+// Compiles the programs into a function that evaluates step code in their scope. The programs start on the first
+// line of the script, so the line numbers in stack traces match the line numbers of the program text.
+function compileProgramExecutor(bot, mcData, programs) {
+    const params = ["bot", "mcData", ...Object.keys(PROGRAM_SCOPE)];
+    const source =
+        "(function (" + params.join(", ") + ") {" + programs + "\n" +
+        FAIL_COUNTS.map((name) => `let ${name} = 0;`).join(" ") + "\n" +
+        "return async function (__code, __prefix) {\n" +
+        FAIL_COUNTS.map((name) => `${name} = 0;`).join(" ") + "\n" +
+        'return await eval("(async () => {" + __prefix + __code + "})()");\n' +
+        "};\n})";
+    const factory = new vm.Script(source, { filename: "<anonymous>" }).runInThisContext();
+    return factory(bot, mcData, ...Object.values(PROGRAM_SCOPE));
+}
+
+// One process-wide uncaughtException listener, attached only while steps are running so that other errors still
+// crash the process as before
+const stepErrorHandlers = new Set();
+
+function dispatchStepError(err) {
+    for (const handler of stepErrorHandlers) {
+        handler(err);
+    }
+}
+
+function addStepErrorHandler(handler) {
+    if (stepErrorHandlers.size === 0) {
+        process.on("uncaughtException", dispatchStepError);
+    }
+    stepErrorHandlers.add(handler);
+}
+
+function removeStepErrorHandler(handler) {
+    stepErrorHandlers.delete(handler);
+    if (stepErrorHandlers.size === 0) {
+        process.off("uncaughtException", dispatchStepError);
+    }
+}
+
+// Report the size of the request body and the time it took to parse it
+app.use((req, res, next) => {
+    req.receivedAt = process.hrtime.bigint();
+    next();
+});
 app.use(bodyParser.json({ limit: "50mb" }));
 app.use(bodyParser.urlencoded({ limit: "50mb", extended: false }));
+app.use((req, res, next) => {
+    const parseMs = Number(process.hrtime.bigint() - req.receivedAt) / 1e6;
+    res.set("X-Parse-Ms", parseMs.toFixed(3));
+    next();
+});
 
-app.post("/start", (req, res) => {
-    if (bot) onDisconnect("Restarting bot");
-    bot = null;
-    // console.log(req.body);
-    bot = mineflayer.createBot({
-        host: "localhost", // minecraft server ip
-        port: req.body.port, // minecraft server port
-        username: req.body.username, //"bot",
-        disableChatSigning: true,
-        checkTimeoutInterval: 60 * 60 * 1000,
-        version: "1.19.4",
-    });
-    bot.once("error", onConnectionFailed);
-
-    // Event subscriptions
-    bot.waitTicks = req.body.waitTicks;
-    bot.globalTickCounter = 0;
-    bot.stuckTickCounter = 0;
-    bot.stuckPosList = [];
-    bot.iron_pickaxe = false;
-    bot.status = null;
-    bot.chat_count = 0;
-
-    bot.on("kicked", onDisconnect);
-
-    // mounting will cause physicsTick to stop
-    bot.on("mount", () => {
-        bot.dismount();
-    });
+// Every bot gets its own router and its own `bot` variable, which is also the `bot` the evaluated programs use
+function createBotRouter() {
+    let bot = null;
+    const router = express.Router();
+
+    router.post("/start", (req, res) => {
+        // Pooled workers keep the bot connected between resets when it would reconnect with the same identity
+        if (
+            req.body.reuse &&
+            bot &&
+            bot.entity &&
+            !bot._client.ended &&
+            bot.username === req.body.username &&
+            bot.mcPort === req.body.port
+        ) {
+            console.log("Reusing bot connection");
+            bot.waitTicks = req.body.waitTicks;
+            bot.quietTicks = req.body.quietTicks || 0;
+            resetBotState(bot);
+            bot.connectStart = Date.now();
+            bot.loginMs = 0;
+            bot.spawnMs = 0;
+            setupBot(req, res, true);
+            return;
+        }
+
+        if (bot) onDisconnect("Restarting bot");
+        bot = null;
+        // console.log(req.body);
+        bot = mineflayer.createBot({
+            host: "localhost", // minecraft server ip
+            port: req.body.port, // minecraft server port
+            username: req.body.username, //"bot",
+            disableChatSigning: true,
+            checkTimeoutInterval: 60 * 60 * 1000,
+            version: "1.19.4",
+        });
+        bot.once("error", onConnectionFailed);
+
+        // Report how long the connection took so the client does not have to guess
+        bot.connectStart = Date.now();
+        bot.once("login", () => {
+            bot.loginMs = Date.now() - bot.connectStart;
+        });
+
+        // Event subscriptions
+        bot.mcPort = req.body.port;
+        bot.waitTicks = req.body.waitTicks;
+        bot.quietTicks = req.body.quietTicks || 0;
+        bot.waitedTicks = 0;
+        bot.globalTickCounter = 0;
+        bot.stuckTickCounter = 0;
+        bot.stuckPosList = [];
+        bot.iron_pickaxe = false;
+        bot.status = null;
+        bot.chat_count = 0;
+
+        bot.on("kicked", onDisconnect);
+
+        // mounting will cause physicsTick to stop
+        bot.on("mount", () => {
+            bot.dismount();
+        });
+
+        // chat lisener to record other bots messages
+        bot.on('chat', (username, message) => {
+
+            // Emitting a custom event to record the message
+            bot.emit("chatEvent", "bot", `<${username}> ${message}`);
+        });
+
+        bot.once("spawn", async () => {
+            bot.removeListener("error", onConnectionFailed);
+            bot.spawnMs = Date.now() - bot.connectStart;
+            await setupBot(req, res, false);
+        });
 
-    // chat lisener to record other bots messages
-    bot.on('chat', (username, message) => {
-                
-        // Emitting a custom event to record the message
-        bot.emit("chatEvent", "bot", `<${username}> ${message}`);
+        function onConnectionFailed(e) {
+            console.log(e);
+            bot = null;
+            res.status(400).json({ error: e });
+        }
     });
 
-    bot.once("spawn", async () => {
-        bot.removeListener("error", onConnectionFailed);
+    async function setupBot(req, res, reused) {
         let itemTicks = 1;
         if (req.body.reset === "hard") {
             bot.chat("/clear @s");
@@ -105,31 +308,49 @@ app.post("/start", (req, res) => {
             bot.iron_pickaxe = true;
         }
 
-        const { pathfinder } = require("mineflayer-pathfinder");
-        const tool = require("mineflayer-tool").plugin;
-        const collectBlock = require("mineflayer-collectblock").plugin;
-        const pvp = require("mineflayer-pvp").plugin;
-        const minecraftHawkEye = require("minecrafthawkeye");
-        bot.loadPlugin(pathfinder);
-        bot.loadPlugin(tool);
-        bot.loadPlugin(collectBlock);
-        bot.loadPlugin(pvp);
-        // bot.loadPlugin(minecraftHawkEye);
-
-        // bot.collectBlock.movements.digCost = 0;
-        // bot.collectBlock.movements.placeCost = 0;
-
-        obs.inject(bot, [
-            OnChat,
-            OnError,
-            Voxels,
-            Status,
-            Inventory,
-            OnSave,
-            Chests,
-            BlockRecords,
-        ]);
-        skills.inject(bot);
+        if (!reused) {
+            const { pathfinder } = require("mineflayer-pathfinder");
+            const tool = require("mineflayer-tool").plugin;
+            const collectBlock = require("mineflayer-collectblock").plugin;
+            const pvp = require("mineflayer-pvp").plugin;
+            const minecraftHawkEye = require("minecrafthawkeye");
+            bot.loadPlugin(pathfinder);
+            bot.loadPlugin(tool);
+            bot.loadPlugin(collectBlock);
+            bot.loadPlugin(pvp);
+            // bot.loadPlugin(minecraftHawkEye);
+
+            // bot.collectBlock.movements.digCost = 0;
+            // bot.collectBlock.movements.placeCost = 0;
+
+            obs.inject(bot, [
+                OnChat,
+                OnError,
+                Voxels,
+                Status,
+                Inventory,
+                OnSave,
+                Chests,
+                BlockRecords,
+            ]);
+            skills.inject(bot);
+
+            // Set up once per bot what every step used to redo
+            bot.mcData = loadMcData(bot.version);
+            bot.stepMovements = null;
+            bot.programExecutors = new Map();
+            bot.activeSteps = 0;
+            bot.on("physicsTick", onTick);
+
+            // Anything that ends up in the events resets the quiet window of the trailing step wait
+            bot.ticksSinceActivity = 0;
+            const onActivity = () => {
+                bot.ticksSinceActivity = 0;
+            };
+            bot.on("chatEvent", onActivity);
+            bot.on("error", onActivity);
+            bot.inventory.on("updateSlot", onActivity);
+        }
 
         if (req.body.spread) {
             bot.chat(`/spreadplayers ~ ~ 0 300 under 80 false @s`);
@@ -137,16 +358,41 @@ app.post("/start", (req, res) => {
         }
 
         await bot.waitForTicks(bot.waitTicks * itemTicks);
-        res.json(bot.observe());
+        res.set({
+            "X-Login-Ms": String(bot.loginMs || 0),
+            "X-Spawn-Ms": String(bot.spawnMs || 0),
+            "X-Ready-Ms": String(Date.now() - bot.connectStart),
+            "X-Bot-Reused": String(reused),
+        });
+        // A reset always starts a new delta sequence
+        bot.deltaState = createDeltaState();
+        sendObservation(res, 200, bot.observeEvents(), req.body.delta, null);
 
         initCounter(bot);
-    });
+    }
 
-    function onConnectionFailed(e) {
-        console.log(e);
-        bot = null;
-        res.status(400).json({ error: e });
+    function stopActions(bot) {
+        try {
+            bot.pathfinder.setGoal(null);
+        } catch (err) {
+        }
+        bot.pvp.forceStop();
+        bot.clearControlStates();
+        bot.stopDigging();
     }
+
+    function resetBotState(bot) {
+        // Stop whatever the previous step left running
+        stopActions(bot);
+        bot.status = null;
+        bot.stuckTickCounter = 0;
+        bot.stuckPosList = [];
+        // Drop the events of the previous episode
+        bot.cumulativeObs = [];
+        bot.observeFields = null;
+        bot.stepId = null;
+    }
+
     function onDisconnect(message) {
         if (bot.viewer) {
             bot.viewer.close();
@@ -155,75 +401,56 @@ app.post("/start", (req, res) => {
         console.log(message);
         bot = null;
     }
-});
 
-app.post("/step", async (req, res) => {
-    if (bot === null) {
-        return res.status(400).json({ error: "Bot not spawned" });
+    // Sends a list of events as a JSON string inside the JSON body, as clients have always decoded it, or delta
+    // encoded against the observation the client acknowledged
+    function sendObservation(res, code, events, delta, ack, deltaState = bot.deltaState) {
+        if (!Array.isArray(events)) {
+            return res.status(code).json(events);
+        }
+        if (delta) {
+            return res.status(code).json(encodeDelta(deltaState, events, ack));
+        }
+        return res.status(code).json(JSON.stringify(events));
     }
 
-    // import useful package
-    function otherError(err) {
-        console.log("Uncaught Error");
-        bot.emit("error", handleError(err));
-        bot.waitForTicks(bot.waitTicks).then(() => {
-            bot.status = bot.observe();
-        });
+    // Waits up to maxTicks, or only until no events have arrived for bot.quietTicks ticks if that is set, and
+    // reports the ticks waited in the observation
+    async function waitForQuiet(maxTicks) {
+        if (!bot.quietTicks) {
+            await bot.waitForTicks(maxTicks);
+            bot.waitedTicks = maxTicks;
+            return;
+        }
+        bot.ticksSinceActivity = 0;
+        let waited = 0;
+        while (waited < maxTicks && bot.ticksSinceActivity < bot.quietTicks) {
+            await bot.waitForTicks(1);
+            bot.ticksSinceActivity++;
+            waited++;
+        }
+        bot.waitedTicks = waited;
     }
 
-    process.on("uncaughtException", otherError);
-
-    const mcData = require("minecraft-data")(bot.version);
-    mcData.itemsByName["leather_cap"] = mcData.itemsByName["leather_helmet"];
-    mcData.itemsByName["leather_tunic"] =
-        mcData.itemsByName["leather_chestplate"];
-    mcData.itemsByName["leather_pants"] =
-        mcData.itemsByName["leather_leggings"];
-    mcData.itemsByName["leather_boots"] = mcData.itemsByName["leather_boots"];
-    mcData.itemsByName["lapis_lazuli_ore"] = mcData.itemsByName["lapis_ore"];
-    mcData.blocksByName["lapis_lazuli_ore"] = mcData.blocksByName["lapis_ore"];
-    const {
-        Movements,
-        goals: {
-            Goal,
-            GoalBlock,
-            GoalNear,
-            GoalXZ,
-            GoalNearXZ,
-            GoalY,
-            GoalGetToBlock,
-            GoalLookAtBlock,
-            GoalBreakBlock,
-            GoalCompositeAny,
-            GoalCompositeAll,
-            GoalInvert,
-            GoalFollow,
-            GoalPlaceBlock,
-        },
-        pathfinder,
-        Move,
-        ComputedPath,
-        PartiallyComputedPath,
-        XZCoordinates,
-        XYZCoordinates,
-        SafeBlock,
-        GoalPlaceBlockOptions,
-    } = require("mineflayer-pathfinder");
-    const { Vec3 } = require("vec3");
-
-    // Set up pathfinder
-    const movements = new Movements(bot, mcData);
-    bot.pathfinder.setMovements(movements);
-
-    bot.globalTickCounter = 0;
-    bot.stuckTickCounter = 0;
-    bot.debugTickCounter = 0;
-    bot.chatTickCounter = 0;
-    bot.buggedCounter = 0;
-    bot.stuckPosList = [];
-    bot.chat_count = 0;
+    function getProgramExecutor(hash, programs) {
+        let execute = bot.programExecutors.get(hash);
+        if (execute) {
+            // Move it to the end, so the first key is the least recently used one
+            bot.programExecutors.delete(hash);
+        } else {
+            execute = compileProgramExecutor(bot, bot.mcData, programs);
+        }
+        bot.programExecutors.set(hash, execute);
+        while (bot.programExecutors.size > MAX_PROGRAM_EXECUTORS) {
+            bot.programExecutors.delete(bot.programExecutors.keys().next().value);
+        }
+        return execute;
+    }
 
     function onTick() {
+        if (!bot || bot.activeSteps === 0) {
+            return;
+        }
         bot.globalTickCounter++;
         bot.debugTickCounter++;
         bot.chatTickCounter++;
@@ -261,46 +488,6 @@ app.post("/step", async (req, res) => {
         }
     }
 
-    bot.on("physicsTick", onTick);
-
-    // initialize fail count
-    let _craftItemFailCount = 0;
-    let _killMobFailCount = 0;
-    let _mineBlockFailCount = 0;
-    let _placeItemFailCount = 0;
-    let _smeltItemFailCount = 0;
-    let _farmFailCount = 0;
-
-    // Retrieve array form post bod
-    const code = req.body.code;
-    const programs = req.body.programs;
-    bot.cumulativeObs = [];
-
-    bot.status = "working";
-    res.status(202).json({ message: "Accepted" });
-
-    await bot.waitForTicks(bot.waitTicks);
-    const r = await evaluateCode(code, programs);
-    process.off("uncaughtException", otherError);
-    if (r !== "success") {
-        bot.emit("error", handleError(r));
-    }
-    // await returnItems(); commented this out because it's not necessary
-    // wait for last message
-    await bot.waitForTicks(bot.waitTicks);
-    bot.status = bot.observe();
-    bot.removeListener("physicsTick", onTick);
-
-    async function evaluateCode(code, programs) {
-        // Echo the code produced for players to see it. Don't echo when the bot code is already producing dialog or it will double echo
-        try {
-            await eval("(async () => {" + programs + "\n" + code + "})()");
-            return "success";
-        } catch (err) {
-            return err;
-        }
-    }
-
     function onStuck(posThreshold) {
         const currentPos = bot.entity.position;
         bot.stuckPosList.push(currentPos);
@@ -338,142 +525,372 @@ app.post("/step", async (req, res) => {
         }
     }
 
-    function returnItems() {
-        bot.chat("/gamerule doTileDrops false");
-        const crafting_table = bot.findBlock({
-            matching: mcData.blocksByName.crafting_table.id,
-            maxDistance: 128,
-        });
-        if (crafting_table) {
-            bot.chat(
-                `/setblock ${crafting_table.position.x} ${crafting_table.position.y} ${crafting_table.position.z} air destroy`
-            );
-            bot.chat("/give @s crafting_table");
+    router.post("/step", async (req, res) => {
+        if (bot === null) {
+            return res.status(400).json({ error: "Bot not spawned" });
         }
-        const furnace = bot.findBlock({
-            matching: mcData.blocksByName.furnace.id,
-            maxDistance: 128,
-        });
-        if (furnace) {
-            bot.chat(
-                `/setblock ${furnace.position.x} ${furnace.position.y} ${furnace.position.z} air destroy`
-            );
-            bot.chat("/give @s furnace");
+        const setupStart = process.hrtime.bigint();
+
+        // A resent step, e.g. after its response got lost, is not run twice. The client gets its result from /status.
+        if (req.body.stepId && req.body.stepId === bot.stepId) {
+            res.set("X-Step-Reattached", "1");
+            return res.status(202).json({ message: "Accepted" });
         }
-        if (bot.inventoryUsed() >= 32) {
-            // if chest is not in bot's inventory
-            if (!bot.inventory.items().find((item) => item.name === "chest")) {
-                bot.chat("/give @s chest");
+
+        let programs = req.body.programs;
+        if (req.body.programsHash) {
+            if (programs !== undefined) {
+                storeProgram(req.body.programsHash, programs);
+            } else if (programStore.has(req.body.programsHash)) {
+                programs = programStore.get(req.body.programsHash);
+            } else {
+                // The client uploads the text and retries
+                return res.status(409).json({
+                    error: "unknown programs",
+                    programsHash: req.body.programsHash,
+                });
             }
         }
-        // if iron_pickaxe not in bot's inventory and bot.iron_pickaxe
-        if (
-            bot.iron_pickaxe &&
-            !bot.inventory.items().find((item) => item.name === "iron_pickaxe")
-        ) {
-            bot.chat("/give @s iron_pickaxe");
+
+        function otherError(err) {
+            console.log("Uncaught Error");
+            bot.emit("error", handleError(err));
+            waitForQuiet(bot.waitTicks).then(() => {
+                bot.status = bot.observeEvents();
+                bot.emit("stepStatus");
+            });
         }
-        bot.chat("/gamerule doTileDrops true");
-    }
 
-    function handleError(err) {
-        let stack = err.stack;
-        if (!stack) {
-            return err;
+        // In host mode an uncaught exception cannot be attributed to a bot, so every bot with a running step reports it
+        addStepErrorHandler(otherError);
+
+        // compileCache: false rebuilds everything on every step, as before the cache existed
+        const compileCache = req.body.compileCache !== false;
+        if (!compileCache) {
+            bot.mcData = loadMcData(bot.version);
+            bot.stepMovements = null;
         }
-        console.log(stack);
-        const final_line = stack.split("\n")[1];
-        const regex = /<anonymous>:(\d+):\d+\)/;
+        const mcData = bot.mcData;
+
+        // Programs may replace the movements, start every step from the defaults
+        if (!bot.stepMovements || bot.pathfinder.movements !== bot.stepMovements) {
+            bot.stepMovements = new Movements(bot, mcData);
+            bot.pathfinder.setMovements(bot.stepMovements);
+        }
+
+        bot.globalTickCounter = 0;
+        bot.stuckTickCounter = 0;
+        bot.debugTickCounter = 0;
+        bot.chatTickCounter = 0;
+        bot.buggedCounter = 0;
+        bot.stuckPosList = [];
+        bot.chat_count = 0;
 
+        let execute;
+        try {
+            execute = compileCache
+                ? getProgramExecutor(
+                      req.body.programsHash || hashPrograms(programs),
+                      programs
+                  )
+                : compileProgramExecutor(bot, mcData, programs);
+        } catch (err) {
+            // Report syntax errors in the programs like errors in the code
+            execute = async () => {
+                throw err;
+            };
+        }
         const programs_length = programs.split("\n").length;
-        let match_line = null;
-        for (const line of stack.split("\n")) {
-            const match = regex.exec(line);
-            if (match) {
-                const line_num = parseInt(match[1]);
-                if (line_num >= programs_length) {
-                    match_line = line_num - programs_length;
-                    break;
+
+        // Retrieve array form post bod
+        const code = req.body.code;
+        bot.cumulativeObs = [];
+        // Only compute the observations the client reads
+        bot.observeFields = Array.isArray(req.body.observe)
+            ? new Set(req.body.observe)
+            : null;
+
+        bot.status = "working";
+        bot.stepId = req.body.stepId || null;
+        bot.activeSteps++;
+        const setupMs = Number(process.hrtime.bigint() - setupStart) / 1e6;
+        res.set("X-Setup-Ms", setupMs.toFixed(3));
+        res.status(202).json({ message: "Accepted" });
+
+        // /cancel resolves the step without waiting for the code, which cannot be interrupted
+        let isCancelled = false;
+        const cancelled = new Promise((resolve) => {
+            bot.cancelStep = () => {
+                isCancelled = true;
+                resolve(STEP_CANCELLED);
+            };
+        });
+        await Promise.race([bot.waitForTicks(bot.waitTicks), cancelled]);
+        const evaluation = isCancelled ? cancelled : evaluateCode(code);
+        const r = await Promise.race([evaluation, cancelled]);
+        removeStepErrorHandler(otherError);
+        if (r === STEP_CANCELLED) {
+            // The code may still be running, keep its errors from crashing the process until it has settled
+            const onCancelledError = (err) => console.log("Error in cancelled step:", err);
+            addStepErrorHandler(onCancelledError);
+            evaluation.then(() => removeStepErrorHandler(onCancelledError));
+            bot.emit("error", "Step cancelled");
+        } else {
+            if (r !== "success") {
+                bot.emit("error", handleError(r));
+            }
+            // await returnItems(); commented this out because it's not necessary
+            // wait for last message
+            await Promise.race([waitForQuiet(bot.waitTicks), cancelled]);
+        }
+        bot.cancelStep = null;
+        bot.status = bot.observeEvents();
+        bot.emit("stepStatus");
+        bot.activeSteps--;
+
+        async function evaluateCode(code) {
+            // Echo the code produced for players to see it. Don't echo when the bot code is already producing dialog or it will double echo
+            try {
+                // Blank lines in front of the code keep its line numbers where they were when it followed the programs
+                await execute(code, "\n".repeat(programs_length));
+                return "success";
+            } catch (err) {
+                return err;
+            }
+        }
+
+        function returnItems() {
+            bot.chat("/gamerule doTileDrops false");
+            const crafting_table = bot.findBlock({
+                matching: mcData.blocksByName.crafting_table.id,
+                maxDistance: 128,
+            });
+            if (crafting_table) {
+                bot.chat(
+                    `/setblock ${crafting_table.position.x} ${crafting_table.position.y} ${crafting_table.position.z} air destroy`
+                );
+                bot.chat("/give @s crafting_table");
+            }
+            const furnace = bot.findBlock({
+                matching: mcData.blocksByName.furnace.id,
+                maxDistance: 128,
+            });
+            if (furnace) {
+                bot.chat(
+                    `/setblock ${furnace.position.x} ${furnace.position.y} ${furnace.position.z} air destroy`
+                );
+                bot.chat("/give @s furnace");
+            }
+            if (bot.inventoryUsed() >= 32) {
+                // if chest is not in bot's inventory
+                if (!bot.inventory.items().find((item) => item.name === "chest")) {
+                    bot.chat("/give @s chest");
                 }
             }
+            // if iron_pickaxe not in bot's inventory and bot.iron_pickaxe
+            if (
+                bot.iron_pickaxe &&
+                !bot.inventory.items().find((item) => item.name === "iron_pickaxe")
+            ) {
+                bot.chat("/give @s iron_pickaxe");
+            }
+            bot.chat("/gamerule doTileDrops true");
         }
-        if (!match_line) {
+
+        function handleError(err) {
+            let stack = err.stack;
+            if (!stack) {
+                return err;
+            }
+            console.log(stack);
+            const final_line = stack.split("\n")[1];
+            // Frames of the evaluated code read "eval at <anonymous> (<anonymous>:L:C), <anonymous>:L:C)", the last position is the code's
+            const regex = /<anonymous>:(\d+):\d+\)$/;
+
+            let match_line = null;
+            for (const line of stack.split("\n")) {
+                const match = regex.exec(line);
+                if (match) {
+                    const line_num = parseInt(match[1]);
+                    if (line_num >= programs_length) {
+                        match_line = line_num - programs_length;
+                        break;
+                    }
+                }
+            }
+            if (!match_line) {
+                return err.message;
+            }
+            let f_line = final_line.match(
+                /\((?<file>.*):(?<line>\d+):(?<pos>\d+)\)/
+            );
+            if (f_line && f_line.groups && fs.existsSync(f_line.groups.file)) {
+                const { file, line, pos } = f_line.groups;
+                const f = fs.readFileSync(file, "utf8").split("\n");
+                // let filename = file.match(/(?<=node_modules\\)(.*)/)[1];
+                let source = file + `:${line}\n${f[line - 1].trim()}\n `;
+
+                const code_source =
+                    "at " +
+                    code.split("\n")[match_line - 1].trim() +
+                    " in your code";
+                return source + err.message + "\n" + code_source;
+            } else if (
+                f_line &&
+                f_line.groups &&
+                f_line.groups.file.includes("<anonymous>")
+            ) {
+                const { file, line, pos } = f_line.groups;
+                let source =
+                    "Your code" +
+                    `:${match_line}\n${code.split("\n")[match_line - 1].trim()}\n `;
+                let code_source = "";
+                if (line < programs_length) {
+                    source =
+                        "In your program code: " +
+                        programs.split("\n")[line - 1].trim() +
+                        "\n";
+                    code_source = `at line ${match_line}:${code
+                        .split("\n")
+                        [match_line - 1].trim()} in your code`;
+                }
+                return source + err.message + "\n" + code_source;
+            }
             return err.message;
         }
-        let f_line = final_line.match(
-            /\((?<file>.*):(?<line>\d+):(?<pos>\d+)\)/
-        );
-        if (f_line && f_line.groups && fs.existsSync(f_line.groups.file)) {
-            const { file, line, pos } = f_line.groups;
-            const f = fs.readFileSync(file, "utf8").split("\n");
-            // let filename = file.match(/(?<=node_modules\\)(.*)/)[1];
-            let source = file + `:${line}\n${f[line - 1].trim()}\n `;
-
-            const code_source =
-                "at " +
-                code.split("\n")[match_line - 1].trim() +
-                " in your code";
-            return source + err.message + "\n" + code_source;
-        } else if (
-            f_line &&
-            f_line.groups &&
-            f_line.groups.file.includes("<anonymous>")
-        ) {
-            const { file, line, pos } = f_line.groups;
-            let source =
-                "Your code" +
-                `:${match_line}\n${code.split("\n")[match_line - 1].trim()}\n `;
-            let code_source = "";
-            if (line < programs_length) {
-                source =
-                    "In your program code: " +
-                    programs.split("\n")[line - 1].trim() +
-                    "\n";
-                code_source = `at line ${match_line}:${code
-                    .split("\n")
-                    [match_line - 1].trim()} in your code`;
-            }
-            return source + err.message + "\n" + code_source;
+    });
+
+    router.get("/status", (req, res) => {
+        if (bot === null) {
+            return res.status(400).json({ error: "Bot not spawned" });
         }
-        return err.message;
-    }
-});
 
-app.get("/status", (req, res) => {
-    if (bot === null) {
-        return res.status(400).json({ error: "Bot not spawned" });
-    }
+        // Tell clients that they can hold the request open with ?wait=<seconds> instead of polling
+        res.set("X-Long-Poll", "1");
+        if (req.query.stepId && req.query.stepId !== bot.stepId) {
+            return res.status(404).json({ error: "unknown step" });
+        }
+        const status = bot.status;
+        const delta = req.query.delta === "1";
+        const ack = req.query.ack !== undefined ? parseInt(req.query.ack) : null;
+        if (status !== "working") {
+            return sendObservation(res, 200, status, delta, ack);
+        }
 
-    const status = bot.status;
-    if (status !== "working") {
-        return res.status(200).json(status);
-    }
+        const wait = Math.min(parseFloat(req.query.wait) || 0, MAX_LONG_POLL_SECONDS);
+        if (wait <= 0) {
+            return res.status(202).json(status);
+        }
 
-    return res.status(202).json(status);
-});
+        // Answer as soon as the step has finished, or with 202 once the wait is over
+        const waitingBot = bot;
+        const timer = setTimeout(() => finish(), wait * 1000);
+        function finish() {
+            clearTimeout(timer);
+            waitingBot.removeListener("stepStatus", finish);
+            const status = waitingBot.status;
+            sendObservation(
+                res,
+                status !== "working" ? 200 : 202,
+                status,
+                delta,
+                ack,
+                waitingBot.deltaState
+            );
+        }
+        function cancel() {
+            clearTimeout(timer);
+            waitingBot.removeListener("stepStatus", finish);
+        }
+        waitingBot.once("stepStatus", finish);
+        // Stop waiting if the client goes away
+        res.once("close", cancel);
+    });
 
-app.post("/stop", (req, res) => {
-    bot.end();
-    res.json({
-        message: "Bot stopped",
+    router.post("/cancel", async (req, res) => {
+        if (bot === null) {
+            return res.status(400).json({ error: "Bot not spawned" });
+        }
+
+        const cancelBot = bot;
+        const cancelled = cancelBot.status === "working" && Boolean(cancelBot.cancelStep);
+        stopActions(cancelBot);
+        let events;
+        if (cancelled) {
+            // The step reports its observation as soon as the pending evaluation is dropped
+            const finished = new Promise((resolve) => cancelBot.once("stepStatus", resolve));
+            cancelBot.cancelStep();
+            await finished;
+            events = cancelBot.status;
+        } else {
+            events = cancelBot.observeEvents();
+        }
+        res.set("X-Cancelled", String(cancelled));
+        res.json(JSON.stringify(events));
     });
-});
 
-app.post("/pause", (req, res) => {
-    if (!bot) {
-        res.status(400).json({ error: "Bot not spawned" });
-        return;
-    }
-    bot.chat("/pause");
-    bot.waitForTicks(bot.waitTicks).then(() => {
-        res.json({ message: "Success" });
+    router.post("/stop", (req, res) => {
+        if (bot) {
+            bot.end();
+        }
+        res.json({
+            message: "Bot stopped",
+        });
     });
-});
+
+    router.get("/health", (req, res) => {
+        res.json({
+            uptime: process.uptime(),
+            username: bot ? bot.username : null,
+            connected: Boolean(bot && bot.entity && !bot._client.ended),
+            memory: process.memoryUsage(),
+        });
+    });
+
+    router.post("/pause", (req, res) => {
+        if (!bot) {
+            res.status(400).json({ error: "Bot not spawned" });
+            return;
+        }
+        bot.chat("/pause");
+        bot.waitForTicks(bot.waitTicks).then(() => {
+            res.json({ message: "Success" });
+        });
+    });
+
+    return router;
+}
+
+// In host mode a single process serves many bots under /bots/<name>/..., otherwise one bot under /
+const HOST_MODE = process.argv.includes("--host");
+
+if (HOST_MODE) {
+    const routers = new Map();
+    app.get("/health", (req, res) => {
+        res.json({
+            uptime: process.uptime(),
+            bots: Array.from(routers.keys()),
+            memory: process.memoryUsage(),
+        });
+    });
+    app.use("/bots/:name", (req, res, next) => {
+        const name = req.params.name;
+        if (!routers.has(name)) {
+            routers.set(name, createBotRouter());
+        }
+        routers.get(name)(req, res, next);
+    });
+} else {
+    app.use("/", createBotRouter());
+}
 
 // Server listening to PORT 3000
 
 const DEFAULT_PORT = 3000;
 const PORT = process.argv[2] || DEFAULT_PORT;
-app.listen(PORT, () => {
+const server = app.listen(PORT, () => {
     console.log(`Server started on port ${PORT}`);
 });
+// Keep idle client connections open between steps so they can be reused
+server.keepAliveTimeout = 65 * 1000;
+server.headersTimeout = 66 * 1000;
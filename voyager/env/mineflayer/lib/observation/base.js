@@ -21,6 +21,11 @@ function inject(bot, obs_list) {
     bot.obsList = [];
     bot.cumulativeObs = [];
     bot.eventMemory = {};
+    // Names of the observations a step asked for, null for all of them
+    bot.observeFields = null;
+    bot.isObserved = function (name) {
+        return bot.observeFields === null || bot.observeFields.has(name);
+    };
     obs_list.forEach((obs) => {
         bot.obsList.push(new obs(bot));
     });
@@ -30,15 +35,22 @@ function inject(bot, obs_list) {
             if (obs.name.startsWith("on") && obs.name !== event_name) {
                 return;
             }
+            // The observation of the event itself is always included, the others only if they were asked for
+            if (obs.name !== event_name && !bot.isObserved(obs.name)) {
+                return;
+            }
             result[obs.name] = obs.observe();
         });
         bot.cumulativeObs.push([event_name, result]);
     };
-    bot.observe = function () {
+    bot.observeEvents = function () {
         bot.event("observe");
         const result = bot.cumulativeObs;
         bot.cumulativeObs = [];
-        return JSON.stringify(result);
+        return result;
+    };
+    bot.observe = function () {
+        return JSON.stringify(bot.observeEvents());
     };
 }
 
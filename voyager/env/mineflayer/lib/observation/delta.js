@@ -0,0 +1,101 @@
+// Delta encoding of observations. Every event only carries the fields that changed since the previous event, with
+// the first event of a response diffed against the last observation the client acknowledged. Unchanged fields are
+// listed under "$same", objects of which only some keys changed are sent as {"$patch": {...}, "$delete": [...]}.
+// voyager/env/obs_delta.py reconstructs the full events.
+
+// Sequences start at a random number, so an acknowledgement from before a reset never matches a new sequence
+function createDeltaState() {
+    return { seq: Math.floor(Math.random() * 1e9), values: {} };
+}
+
+function isObject(value) {
+    return value !== null && typeof value === "object" && !Array.isArray(value);
+}
+
+// Serializes the fields of an observation result, and the keys of the fields that are objects
+function serializeFields(result) {
+    const fields = {};
+    for (const key in result) {
+        const value = result[key];
+        const json = JSON.stringify(value);
+        if (json === undefined) continue;
+        const entry = { json, value, keys: null };
+        if (isObject(value)) {
+            entry.keys = {};
+            for (const k in value) {
+                const keyJson = JSON.stringify(value[k]);
+                if (keyJson !== undefined) {
+                    entry.keys[k] = keyJson;
+                }
+            }
+        }
+        fields[key] = entry;
+    }
+    return fields;
+}
+
+function encodeResult(result, values) {
+    const encoded = {};
+    const same = [];
+    for (const [key, entry] of Object.entries(serializeFields(result))) {
+        const previous = values[key];
+        values[key] = entry;
+        if (previous && previous.json === entry.json) {
+            same.push(key);
+        } else if (previous && previous.keys && entry.keys) {
+            const patch = {};
+            let changed = 0;
+            for (const k in entry.keys) {
+                if (previous.keys[k] !== entry.keys[k]) {
+                    patch[k] = entry.value[k];
+                    changed++;
+                }
+            }
+            const removed = Object.keys(previous.keys).filter(
+                (k) => !(k in entry.keys)
+            );
+            // Only worth it if most of the object stays the same
+            if (changed + removed.length < Object.keys(entry.keys).length / 2) {
+                encoded[key] = { $patch: patch, $delete: removed };
+            } else {
+                encoded[key] = entry.value;
+            }
+        } else {
+            encoded[key] = entry.value;
+        }
+    }
+    if (same.length > 0) {
+        encoded.$same = same;
+    }
+    return encoded;
+}
+
+// Encodes events, a list of [event name, result], against the observation acknowledged by the client. If ack is not
+// the last sequence number sent, the client missed a response and gets full events.
+function encodeDelta(state, events, ack) {
+    const base = ack === state.seq ? state.seq : null;
+    const values = base === null ? {} : { ...state.values };
+    const encoded = events.map(([name, result]) => [
+        name,
+        encodeResult(result, values),
+    ]);
+    state.seq++;
+    state.values = values;
+    return { seq: state.seq, base, events: encoded };
+}
+
+module.exports = { createDeltaState, encodeDelta };
+
+// Encodes a recorded episode, one JSON list of events per line, as if the client acknowledged every observation
+if (require.main === module) {
+    const fs = require("fs");
+    const state = createDeltaState();
+    let ack = null;
+    const lines = fs.readFileSync(process.argv[2], "utf8").split("\n");
+    for (const line of lines) {
+        if (!line.trim()) continue;
+        const envelope = encodeDelta(state, JSON.parse(line), ack);
+        ack = envelope.seq;
+        process.stdout.write(JSON.stringify(envelope) + "\n");
+    }
+}
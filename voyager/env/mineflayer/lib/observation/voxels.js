@@ -20,7 +20,7 @@ class BlockRecords extends Observation {
         this.tick = 0;
         bot.on("physicsTick", () => {
             this.tick++;
-            if (this.tick >= 100) {
+            if (this.tick >= 100 && this.bot.isObserved(this.name)) {
                 const items = getInventoryItems(this.bot);
                 getSurroundingBlocks(this.bot, 8, 2, 8).forEach((block) => {
                     if (!items.has(block)) this.records.add(block);
@@ -0,0 +1,112 @@
+import logging
+import os.path
+import threading
+
+import requests
+
+import voyager.utils as U
+
+from .process_monitor import SubprocessMonitor
+
+logger = logging.getLogger(__name__)
+
+
+class MineflayerPool:
+    """
+    Keeps mineflayer server processes resident across resets and episodes, one per server port.
+
+    Environments that use the pool only re-create or reuse the bot connection on reset instead of restarting
+    node. The pool checks the health of a worker before handing it out and replaces workers that crashed or
+    stopped answering.
+    """
+
+    def __init__(self, server_host: str = "http://127.0.0.1", health_timeout: float = 2, ready_timeout: float = 60):
+        self.server_host = server_host
+        self.health_timeout = health_timeout
+        self.ready_timeout = ready_timeout
+        self.workers: dict[int, SubprocessMonitor] = {}
+        self.worker_log_paths: dict[int, tuple[str, str]] = {}
+        self.lock = threading.Lock()
+
+    def get_worker(self, server_port: int, name: str, log_path: str) -> SubprocessMonitor:
+        """
+        Returns the worker for server_port, with its output directed to a log file in log_path.
+        The worker is not started until ensure_worker is called.
+        """
+        name = self.worker_name(name)
+        U.f_mkdir(log_path, "mineflayer")
+        with self.lock:
+            worker = self.workers.get(server_port)
+            if worker is None:
+                worker = SubprocessMonitor(
+                    commands=self.worker_commands(server_port),
+                    name=name,
+                    ready_match=r"Server started on port (\d+)",
+                    log_path=U.f_join(log_path, "mineflayer"),
+                )
+                self.workers[server_port] = worker
+            elif self.worker_log_paths[server_port] != (log_path, name):
+                worker.set_log_path(U.f_join(log_path, "mineflayer"), name)
+            self.worker_log_paths[server_port] = (log_path, name)
+            return worker
+
+    def ensure_worker(self, server_port: int) -> SubprocessMonitor:
+        """
+        Makes sure the worker for server_port is running and answering, (re)starting it if needed.
+        """
+        with self.lock:
+            worker = self.workers[server_port]
+            if worker.is_running and not self.is_healthy(server_port):
+                logger.warning(f"Mineflayer worker on port {server_port} is not responding, replacing it")
+                worker.stop()
+            if not worker.is_running:
+                logger.info(f"Starting mineflayer worker on port {server_port}")
+                worker.run(timeout=self.ready_timeout)
+            return worker
+
+    def server_url(self, server_port: int, username: str) -> str:
+        """
+        Returns the base URL of the routes that control the given bot.
+        """
+        return f"{self.server_host}:{server_port}"
+
+    def worker_name(self, username: str) -> str:
+        return username
+
+    def worker_commands(self, server_port: int) -> list[str]:
+        file_path = os.path.abspath(os.path.dirname(__file__))
+        return [
+            "node",
+            U.f_join(file_path, "mineflayer/index.js"),
+            str(server_port),
+        ]
+
+    def is_healthy(self, server_port: int) -> bool:
+        try:
+            res = requests.get(f"{self.server_host}:{server_port}/health", timeout=self.health_timeout)
+            return res.status_code == 200
+        except requests.RequestException:
+            return False
+
+    def stop(self):
+        with self.lock:
+            for worker in self.workers.values():
+                worker.stop()
+            self.workers.clear()
+            self.worker_log_paths.clear()
+
+
+class MineflayerHost(MineflayerPool):
+    """
+    Runs all bots that share a server port in a single mineflayer process, which serves each bot under
+    /bots/<username>/. Compared to one process per bot, this saves a node heap and a startup per bot.
+    """
+
+    def server_url(self, server_port: int, username: str) -> str:
+        return f"{self.server_host}:{server_port}/bots/{username}"
+
+    def worker_name(self, username: str) -> str:
+        return "mineflayer_host"
+
+    def worker_commands(self, server_port: int) -> list[str]:
+        return super().worker_commands(server_port) + ["--host"]
@@ -0,0 +1,50 @@
+from typing import Any, Optional
+
+Events = list[list]
+
+
+class ObservationDecoder:
+    """
+    Reconstructs the full events of delta-encoded observations (see mineflayer/lib/observation/delta.js).
+
+    The decoder keeps the last value of every observation field and the sequence number of the last observation it
+    decoded, which the client sends back as acknowledgement. Events that refer to fields it does not have are an
+    error, since the server only diffs against an acknowledged observation.
+    """
+
+    def __init__(self):
+        self.seq: Optional[int] = None
+        self.values: dict[str, Any] = {}
+
+    def reset(self):
+        self.seq = None
+        self.values = {}
+
+    def decode(self, envelope: dict) -> Events:
+        base = envelope["base"]
+        if base is None:
+            values = {}
+        elif base == self.seq:
+            values = dict(self.values)
+        else:
+            raise RuntimeError(f"Observation {envelope['seq']} is a delta to {base}, but the last one was {self.seq}")
+
+        events = []
+        for name, encoded in envelope["events"]:
+            result = {}
+            for key, value in encoded.items():
+                if key == "$same":
+                    for same_key in value:
+                        result[same_key] = values[same_key]
+                elif isinstance(value, dict) and "$patch" in value:
+                    patched = {k: v for k, v in values[key].items() if k not in value["$delete"]}
+                    patched.update(value["$patch"])
+                    result[key] = patched
+                else:
+                    result[key] = value
+            values.update(result)
+            events.append([name, result])
+
+        self.seq = envelope["seq"]
+        self.values = values
+        return events
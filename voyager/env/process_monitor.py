@@ -1,18 +1,123 @@
 import os
 import time
 import re
+import selectors
 import warnings
 from typing import List, Optional, Callable
 
 import psutil
 import subprocess
 import logging
+import logging.handlers
 import threading
 
 import voyager.utils as U
 
 
+class LineWatcher:
+    """
+    Waits for the first output line of a subprocess that matches a pattern.
+    """
+
+    def __init__(self, pattern: str):
+        self.pattern = re.compile(pattern)
+        self.event = threading.Event()
+        self.match: Optional[re.Match] = None
+
+    def feed(self, line: str):
+        if self.event.is_set():
+            return
+        if match := self.pattern.search(line):
+            self.match = match
+            self.event.set()
+
+    def wait(self, timeout: Optional[float] = None) -> Optional[re.Match]:
+        self.event.wait(timeout)
+        return self.match
+
+
+# Supervised processes log through a buffer into files that rotate at this size
+LOG_MAX_BYTES = 50 * 1024 * 1024
+LOG_BACKUPS = 2
+LOG_BUFFER_LINES = 256
+LOG_FLUSH_INTERVAL = 1
+
+
+class ProcessSupervisor:
+    """
+    Reads the output of many subprocesses on a single thread.
+
+    Instead of one reader thread per process, the supervisor waits on the stdout pipes of all registered
+    processes with a selector and hands complete lines to their monitors. It also flushes the buffered logs of the
+    monitors once per LOG_FLUSH_INTERVAL. Selecting on pipes needs POSIX, so the supervisor is not available on
+    Windows.
+    """
+
+    def __init__(self):
+        if os.name != "posix":
+            raise RuntimeError("ProcessSupervisor needs POSIX pipes, set process_supervisor: false on Windows")
+        self.selector = selectors.DefaultSelector()
+        self.pending: list["SubprocessMonitor"] = []
+        self.monitors: set["SubprocessMonitor"] = set()
+        self.lock = threading.Lock()
+        # Registrations from other threads wake up the loop through this pipe
+        self.wakeup_read, self.wakeup_write = os.pipe()
+        os.set_blocking(self.wakeup_read, False)
+        self.selector.register(self.wakeup_read, selectors.EVENT_READ)
+        self.thread = threading.Thread(target=self._loop, name="process_supervisor", daemon=True)
+        self.thread.start()
+
+    def register(self, monitor: "SubprocessMonitor"):
+        with self.lock:
+            self.pending.append(monitor)
+        os.write(self.wakeup_write, b"\0")
+
+    def _loop(self):
+        last_flush = time.time()
+        while True:
+            for key, _ in self.selector.select(timeout=LOG_FLUSH_INTERVAL):
+                if key.data is None:
+                    self._add_pending()
+                else:
+                    self._read(key.fileobj, key.data)
+            if time.time() - last_flush >= LOG_FLUSH_INTERVAL:
+                for monitor in list(self.monitors):
+                    monitor.flush_log()
+                last_flush = time.time()
+
+    def _add_pending(self):
+        try:
+            os.read(self.wakeup_read, 4096)
+        except BlockingIOError:
+            pass
+        with self.lock:
+            pending, self.pending = self.pending, []
+        for monitor in pending:
+            stdout = monitor.process.stdout
+            os.set_blocking(stdout.fileno(), False)
+            self.selector.register(stdout, selectors.EVENT_READ, monitor)
+            self.monitors.add(monitor)
+
+    def _read(self, stdout, monitor: "SubprocessMonitor"):
+        try:
+            data = os.read(stdout.fileno(), 65536)
+        except BlockingIOError:
+            return
+        if data:
+            monitor.feed(data)
+            return
+        # End of output, the process has exited or is about to
+        self.selector.unregister(stdout)
+        self.monitors.discard(monitor)
+        monitor.feed(b"", final=True)
+        # Waiting for the exit code and the finished callback must not hold up the other processes
+        threading.Thread(target=monitor._handle_exit, daemon=True).start()
+
+
 class SubprocessMonitor:
+    # Supervisor for monitors that are not given one, None reads every process on its own thread
+    default_supervisor: Optional[ProcessSupervisor] = None
+
     def __init__(
         self,
         commands: List[str],
@@ -23,70 +128,202 @@ class SubprocessMonitor:
         callback: Callable = None,
         finished_callback: callable = None,
         cwd: os.PathLike = None,
+        supervisor: Optional[ProcessSupervisor] = None,
     ):
         self.commands = commands
-        start_time = time.strftime("%Y%m%d_%H%M%S")
         self.name = name
-        self.logger = logging.getLogger(name)
-        # Clear existing handlers from previous runs
-        for handler in self.logger.handlers:
-            self.logger.removeHandler(handler)
-        if log_path is not None:
-            handler = logging.FileHandler(U.f_join(log_path, f"{name}_{start_time}.log"))
-            formatter = logging.Formatter(
-                "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-            )
-            handler.setFormatter(formatter)
-            self.logger.addHandler(handler)
-        self.logger.setLevel(logging.INFO)
+        self.supervisor = supervisor or SubprocessMonitor.default_supervisor
+        self.logger = None
+        self.log_name: Optional[str] = None
+        self.log_buffer: Optional[logging.handlers.MemoryHandler] = None
+        self.set_log_path(log_path)
         self.process: Optional[psutil.Popen] = None
         self.ready_match = ready_match
+        self.ready_pattern = re.compile(ready_match)
         self.ready_event = None
+        self.exited_event = threading.Event()
+        self.exited_event.set()
         self.ready_line = None
         self.callback_match = callback_match
+        self.callback_pattern = re.compile(callback_match)
         self.callback = callback
         self.finished_callback = finished_callback
         self.cwd = cwd
         self.thread = None
+        self.watchers: list[LineWatcher] = []
+        self.watchers_lock = threading.Lock()
+        self.stdin_lock = threading.Lock()
+        self.partial_line = b""
 
-    def _start(self):
+    def set_log_path(self, log_path: Optional[str], name: Optional[str] = None):
+        """
+        Directs the output to a new log file in log_path, e.g. when a long-lived process serves a new episode.
+        """
+        if name is not None:
+            self.name = name
+        start_time = time.strftime("%Y%m%d_%H%M%S")
+        log_file = U.f_join(log_path, f"{self.name}_{start_time}.log") if log_path is not None else None
+        # Key the logger by its log file so that bots with the same name in parallel episodes don't share handlers
+        log_name = log_file or self.name
+        logger = logging.getLogger(log_name)
+        # Clear existing handlers from previous runs
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+            handler.close()
+        self.log_buffer = None
+        if log_file is not None:
+            formatter = logging.Formatter(
+                f"%(asctime)s - {self.name} - %(levelname)s - %(message)s"
+            )
+            if self.supervisor is not None:
+                handler = logging.handlers.RotatingFileHandler(
+                    log_file, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUPS)
+                handler.setFormatter(formatter)
+                # Written in batches, the supervisor flushes what is left once per LOG_FLUSH_INTERVAL
+                self.log_buffer = logging.handlers.MemoryHandler(
+                    LOG_BUFFER_LINES, flushLevel=logging.WARNING, target=handler, flushOnClose=True)
+                logger.addHandler(self.log_buffer)
+            else:
+                handler = logging.FileHandler(log_file)
+                handler.setFormatter(formatter)
+                logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+
+        previous_name, self.log_name = self.log_name, log_name
+        self.logger = logger
+        if previous_name is not None and previous_name != log_name:
+            U.close_logger(previous_name)
+
+    def close_log(self):
+        """
+        Closes the log file once the process is not used anymore.
+        """
+        self.flush_log()
+        self.log_buffer = None
+        if self.log_name is not None:
+            U.close_logger(self.log_name)
+
+    def flush_log(self):
+        if self.log_buffer is not None:
+            self.log_buffer.flush()
+
+    def _spawn(self):
         self.logger.info(f"Starting subprocess with commands: {self.commands}")
 
-        self.process = psutil.Popen(
-            self.commands,
-            stdin=subprocess.PIPE,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            universal_newlines=True,
-            cwd=self.cwd,
-        )
+        # The supervisor reads raw bytes from the pipe and decodes complete lines itself
+        try:
+            self.process = psutil.Popen(
+                self.commands,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.STDOUT,
+                universal_newlines=self.supervisor is None,
+                cwd=self.cwd,
+            )
+        except Exception:
+            # There is no output to wait for, so neither run nor stop may wait for it
+            self.ready_event.set()
+            self.exited_event.set()
+            raise
         self.logger.info(f"Subprocess {self.name} started with PID {self.process.pid}.")
+
+    def _start(self):
+        self._spawn()
         for line in iter(self.process.stdout.readline, ""):
-            self.logger.info(line.strip())
-            if re.search(self.ready_match, line):
-                self.ready_line = line
-                self.logger.info("Subprocess is ready.")
-                self.ready_event.set()
-            if match := re.search(self.callback_match, line):
-                self.callback(match)
+            self._handle_line(line)
+        self._handle_exit()
+
+    def feed(self, data: bytes, final: bool = False):
+        """
+        Handles a chunk of output read by the supervisor, which may end in the middle of a line.
+        """
+        lines = (self.partial_line + data).split(b"\n")
+        self.partial_line = lines.pop()
+        if final and self.partial_line:
+            lines.append(self.partial_line)
+            self.partial_line = b""
+        for line in lines:
+            self._handle_line(line.decode("utf-8", errors="replace").rstrip("\r") + "\n")
+
+    def _handle_line(self, line: str):
+        self.logger.info(line.strip())
+        if self.ready_pattern.search(line):
+            self.ready_line = line
+            self.logger.info("Subprocess is ready.")
+            self.ready_event.set()
+        if match := self.callback_pattern.search(line):
+            self.callback(match)
+        with self.watchers_lock:
+            for watcher in self.watchers:
+                watcher.feed(line)
+
+    def _handle_exit(self):
         if not self.ready_event.is_set():
             self.ready_event.set()
             warnings.warn(f"Subprocess {self.name} failed to start.")
+        self.process.wait()
+        self.flush_log()
+        self.exited_event.set()
         if self.finished_callback:
             self.finished_callback()
 
-    def run(self):
+    def run(self, timeout: Optional[float] = None):
+        """
+        Starts the process and waits until it prints a line matching ready_match, or until it exits.
+        Raises TimeoutError and stops the process if it is not ready within timeout seconds.
+        """
         self.ready_event = threading.Event()
+        self.exited_event = threading.Event()
         self.ready_line = None
-        self.thread = threading.Thread(target=self._start)
-        self.thread.start()
-        self.ready_event.wait()
+        self.partial_line = b""
+        if self.supervisor is not None:
+            self.thread = None
+            self._spawn()
+            self.supervisor.register(self)
+        else:
+            self.thread = threading.Thread(target=self._start)
+            self.thread.start()
+        if not self.ready_event.wait(timeout):
+            self.stop()
+            raise TimeoutError(f"Subprocess {self.name} was not ready after {timeout}s")
+
+    def watch(self, pattern: str) -> LineWatcher:
+        """
+        Registers a watcher for the next output line matching pattern. Register before triggering the output.
+        """
+        watcher = LineWatcher(pattern)
+        with self.watchers_lock:
+            self.watchers.append(watcher)
+        return watcher
+
+    def unwatch(self, watcher: LineWatcher):
+        with self.watchers_lock:
+            if watcher in self.watchers:
+                self.watchers.remove(watcher)
 
-    def stop(self):
+    def write_line(self, line: str):
+        if not self.is_running:
+            raise RuntimeError(f"Subprocess {self.name} is not running")
+        data = f"{line}\n"
+        with self.stdin_lock:
+            self.process.stdin.write(data if self.supervisor is None else data.encode("utf-8"))
+            self.process.stdin.flush()
+
+    def stop(self, timeout: Optional[float] = 10):
         self.logger.info("Stopping subprocess.")
         if self.process and self.process.is_running():
             self.process.terminate()
             self.process.wait()
+        # The process has released its ports once the reader has seen the end of its output
+        self.wait_exited(timeout)
+
+    def wait_exited(self, timeout: Optional[float] = None) -> bool:
+        """
+        Waits until the process has exited and its output has been read.
+        """
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join(timeout)
+        return self.exited_event.wait(timeout)
 
     # def __del__(self):
     #     if self.process.is_running():
@@ -1,16 +1,46 @@
+import asyncio
+import importlib.util
 import logging
 import os
+import threading
 import time
-from typing import Optional
+from typing import Any, Callable, Optional
 
+import httpx
 from langchain_core.language_models import BaseChatModel
-from langchain_core.messages import SystemMessage
+from langchain_core.messages import AIMessage, SystemMessage
 from langchain_deepseek import ChatDeepSeek
 from langchain_openai import ChatOpenAI
 from langchain_ollama import ChatOllama
 
+from voyager.llm_cache import LLMCache, cache_key
+from voyager.llm_limiter import DEFAULT_PRIORITY, RateLimits, estimate_tokens
+
 logger = logging.getLogger(__name__)
 
+# Set by set_response_cache to answer repeated requests from disk
+response_cache: Optional[LLMCache] = None
+# Shared by all clients of the process, see set_rate_limits
+rate_limits = RateLimits()
+
+# Chat models and their HTTP clients are built once per process, see create_llm
+model_registry: dict[tuple, BaseChatModel] = {}
+http_client_registry: dict[tuple, tuple[httpx.Client, httpx.AsyncClient]] = {}
+registry_lock = threading.Lock()
+event_loop: Optional[asyncio.AbstractEventLoop] = None
+HTTP2 = importlib.util.find_spec("h2") is not None
+HTTP_MAX_CONNECTIONS = 64
+
+
+def set_response_cache(cache: Optional[LLMCache]):
+    global response_cache
+    response_cache = cache
+
+
+def set_rate_limits(limits: Optional[dict[str, dict[str, float]]]):
+    global rate_limits
+    rate_limits = RateLimits(limits)
+
 
 class ChatOpenRouter(ChatOpenAI):
     openai_api_base: str
@@ -28,30 +58,82 @@ class ChatOpenRouter(ChatOpenAI):
                          model_name=model_name, **kwargs)
 
 
+def http_clients(provider: str, base_url: Optional[str]) -> tuple[httpx.Client, httpx.AsyncClient]:
+    """
+    Returns the pooled HTTP clients shared by all chat models of a provider and base URL. HTTP/2 is used if h2 is
+    installed. Timeouts are set per request by the chat models.
+    """
+    key = (provider, base_url)
+    with registry_lock:
+        if key not in http_client_registry:
+            limits = httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=HTTP_MAX_CONNECTIONS)
+            http_client_registry[key] = (
+                httpx.Client(http2=HTTP2, limits=limits),
+                httpx.AsyncClient(http2=HTTP2, limits=limits),
+            )
+        return http_client_registry[key]
+
+
 def create_llm(
         model_name,
         temperature,
         request_timeout,
+) -> BaseChatModel:
+    """
+    Returns the chat model for these parameters. Chat models are thread-safe and shared by all callers in the process,
+    so only the first call for each set of parameters builds a client.
+    """
+    key = (model_name, temperature, request_timeout)
+    with registry_lock:
+        model = model_registry.get(key)
+    if model is not None:
+        return model
+
+    start_time = time.time()
+    model = build_llm(model_name, temperature, request_timeout)
+    with registry_lock:
+        # Another thread may have built the same model in the meantime
+        model = model_registry.setdefault(key, model)
+    logger.info(f"Created LLM client for {model_name} in {time.time() - start_time:.2f}s")
+    return model
+
+
+def build_llm(
+        model_name,
+        temperature,
+        request_timeout,
 ) -> BaseChatModel:
     if model_name.startswith("gpt"):
+        http_client, http_async_client = http_clients("openai", os.getenv("OPENAI_BASE_URL"))
         model = ChatOpenAI(
             model_name=model_name,
             temperature=temperature,
             request_timeout=request_timeout,
             max_retries=10,
+            stream_usage=True,
+            http_client=http_client,
+            http_async_client=http_async_client,
         )
     elif model_name.startswith("o3") or model_name.startswith("o1"):
+        http_client, http_async_client = http_clients("openai", os.getenv("OPENAI_BASE_URL"))
         model = ChatOpenAI(
             model_name=model_name,
             request_timeout=request_timeout,
             max_retries=10,
+            stream_usage=True,
+            http_client=http_client,
+            http_async_client=http_async_client,
         )
     elif model_name.startswith("deepseek"):
+        http_client, http_async_client = http_clients("deepseek", None)
         model = ChatDeepSeek(
             model_name=model_name,
             temperature=temperature,
             request_timeout=request_timeout,
             max_retries=10,
+            stream_usage=True,
+            http_client=http_client,
+            http_async_client=http_async_client,
         )
     elif model_name.startswith("ollama-"):
         model = ChatOllama(
@@ -63,6 +145,7 @@ def create_llm(
             num_ctx=16382,
         )
     elif model_name.startswith("openrouter-"):
+        http_client, http_async_client = http_clients("openrouter", "https://openrouter.ai/api/v1")
         model = ChatOpenAI(
             model_name=model_name[11:],
             temperature=temperature,
@@ -70,6 +153,8 @@ def create_llm(
             max_retries=10,
             api_key=os.getenv('OPENROUTER_API_KEY'),
             base_url="https://openrouter.ai/api/v1",
+            http_client=http_client,
+            http_async_client=http_async_client,
         )
     else:
         raise ValueError(f"Unknown model name: {model_name}")
@@ -77,7 +162,7 @@ def create_llm(
     return model
 
 
-def invoke_with_log(model: BaseChatModel, messages, *args, prefix="", **kwargs):
+def use_developer_messages(model: BaseChatModel, messages):
     model_name = model.model_name
     if model_name.startswith("o3") or model_name.startswith("o1") or model_name.startswith("openrouter-o3"):
         # Replace system messages with developer messages
@@ -87,16 +172,221 @@ def invoke_with_log(model: BaseChatModel, messages, *args, prefix="", **kwargs):
             elif isinstance(message, dict) and message.get("role") == "system":
                 messages[i] = {"role": "developer", "content": message.get("content")}
 
+
+def lookup_cache(model: BaseChatModel, messages, args, kwargs, prefix,
+                 attempt) -> tuple[Optional[str], Optional[AIMessage]]:
+    """
+    Returns the cache key of the request, or None without a cache, and the cached response if there is one.
+    """
+    if response_cache is None:
+        return None, None
+    key = cache_key(model, messages, {"args": args, **kwargs}, attempt)
+    cached = response_cache.get(key)
+    if cached is None:
+        return key, None
+    response = AIMessage(**cached)
+    logger.info(f"{prefix}AI invoke: response time: 0.00s, usage metadata: {response.usage_metadata}, "
+                f"cache: hit ({response_cache.stats()})")
+    return key, response
+
+
+def log_response(response, key: Optional[str], elapsed_time: float, prefix: str, limit_info: str):
+    cache_info = ""
+    if key is not None:
+        response_cache.put(key, {
+            "content": response.content,
+            "usage_metadata": response.usage_metadata,
+            "response_metadata": response.response_metadata,
+        })
+        cache_info = f", cache: miss ({response_cache.stats()})"
+
+    # Log the time taken and token usage (assuming 'usage' key contains token info)
+    logger.info(f"{prefix}AI invoke: response time: {elapsed_time:.2f}s, usage metadata: {response.usage_metadata}"
+                f"{cache_info}{limit_info}")
+
+
+def used_tokens(response) -> Optional[int]:
+    usage = response.usage_metadata if response is not None else None
+    return usage["total_tokens"] if usage else None
+
+
+def invoke_with_log(model: BaseChatModel, messages, *args, prefix="", priority=DEFAULT_PRIORITY, attempt=0, **kwargs):
+    """
+    Invokes the model and logs the response time and token usage. Callers that retry because a response could not be
+    parsed pass the number of the attempt, which keeps the response cache from answering the retry with the response
+    that failed.
+    """
+    use_developer_messages(model, messages)
+    key, response = lookup_cache(model, messages, args, kwargs, prefix, attempt)
+    if response is not None:
+        return response
+
+    limiter = rate_limits.get(model)
+    estimated_tokens = estimate_tokens(messages)
+    limit_info = ""
+    if limiter is not None:
+        waited, queue_depth = limiter.acquire(estimated_tokens, priority)
+        limit_info = f", rate limit wait: {waited:.2f}s, queue depth: {queue_depth}"
+
     # Start measuring time
     start_time = time.time()
 
     # Call the original invoke method
-    response = model.invoke(messages, *args, **kwargs)
+    try:
+        response = model.invoke(messages, *args, **kwargs)
+    finally:
+        if limiter is not None:
+            limiter.release(estimated_tokens, used_tokens(response))
 
     # Calculate elapsed time
     elapsed_time = time.time() - start_time
 
-    # Log the time taken and token usage (assuming 'usage' key contains token info)
-    logger.info(f"{prefix}AI invoke: response time: {elapsed_time:.2f}s, usage metadata: {response.usage_metadata}")
+    log_response(response, key, elapsed_time, prefix, limit_info)
+    return response
+
+
+async def ainvoke_with_log(model: BaseChatModel, messages, *args, prefix="", priority=DEFAULT_PRIORITY, attempt=0,
+                           **kwargs):
+    """
+    Like invoke_with_log, but awaits the response. Run it on the loop of get_event_loop, whose async HTTP clients
+    are shared with every other request of the process.
+    """
+    use_developer_messages(model, messages)
+    key, response = lookup_cache(model, messages, args, kwargs, prefix, attempt)
+    if response is not None:
+        return response
+
+    limiter = rate_limits.get(model)
+    estimated_tokens = estimate_tokens(messages)
+    limit_info = ""
+    if limiter is not None:
+        waited, queue_depth = await limiter.acquire_async(estimated_tokens, priority)
+        limit_info = f", rate limit wait: {waited:.2f}s, queue depth: {queue_depth}"
 
+    start_time = time.time()
+    try:
+        response = await model.ainvoke(messages, *args, **kwargs)
+    finally:
+        if limiter is not None:
+            limiter.release(estimated_tokens, used_tokens(response))
+    elapsed_time = time.time() - start_time
+
+    log_response(response, key, elapsed_time, prefix, limit_info)
     return response
+
+
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    """
+    Returns the event loop of the process that runs asynchronous LLM requests on a background thread. The pooled async
+    HTTP clients are bound to the loop they first connect on, so all requests share this one.
+    """
+    global event_loop
+    with registry_lock:
+        if event_loop is None:
+            event_loop = asyncio.new_event_loop()
+            threading.Thread(target=event_loop.run_forever, name="llm_event_loop", daemon=True).start()
+        return event_loop
+
+
+def invoke_batch_with_log(calls: list[dict]) -> list:
+    """
+    Sends the requests concurrently and returns their responses in order. Every call is a dict of the arguments of
+    ainvoke_with_log, e.g. {"model": llm, "messages": messages, "prefix": "Action "}.
+    """
+    async def gather():
+        return await asyncio.gather(*(ainvoke_with_log(**call) for call in calls))
+
+    return asyncio.run_coroutine_threadsafe(gather(), get_event_loop()).result()
+
+
+class StreamedResponse:
+    """
+    A response that streams in on a background thread, see stream_with_log. Callers can act on partial content with
+    wait_for while the rest of the response arrives.
+    """
+
+    def __init__(self, start_time: float):
+        self.start_time = start_time
+        self.content = ""
+        self.message: Optional[AIMessage] = None
+        self.error: Optional[BaseException] = None
+        self.done = False
+        self.condition = threading.Condition()
+
+    def wait_for(self, predicate: Callable[[str], Any]) -> tuple[Any, float]:
+        """
+        Calls predicate with the content received so far every time more arrives, until it returns a truthy value or
+        the response is complete. Returns the last value of predicate and the time since the request was sent.
+        """
+        checked = None
+        while True:
+            with self.condition:
+                self.condition.wait_for(lambda: self.done or self.content != checked)
+                content, done = self.content, self.done
+            value = predicate(content)
+            if value or done:
+                return value, time.time() - self.start_time
+            checked = content
+
+    def result(self) -> AIMessage:
+        with self.condition:
+            self.condition.wait_for(lambda: self.done)
+        if self.error is not None:
+            raise self.error
+        return self.message
+
+    def _finish(self, message: Optional[AIMessage], error: Optional[BaseException] = None):
+        with self.condition:
+            self.message = message
+            self.error = error
+            self.done = True
+            self.condition.notify_all()
+
+
+def stream_with_log(model: BaseChatModel, messages, *args, prefix="", priority=DEFAULT_PRIORITY, attempt=0,
+                    **kwargs) -> StreamedResponse:
+    """
+    Like invoke_with_log, but returns as soon as the request is sent and streams the response into a StreamedResponse.
+    The response is logged and cached once it is complete.
+    """
+    use_developer_messages(model, messages)
+    key, cached = lookup_cache(model, messages, args, kwargs, prefix, attempt)
+    streamed = StreamedResponse(time.time())
+    if cached is not None:
+        streamed.content = cached.content
+        streamed._finish(cached)
+        return streamed
+
+    limiter = rate_limits.get(model)
+    estimated_tokens = estimate_tokens(messages)
+    limit_info = ""
+    if limiter is not None:
+        waited, queue_depth = limiter.acquire(estimated_tokens, priority)
+        limit_info = f", rate limit wait: {waited:.2f}s, queue depth: {queue_depth}"
+    streamed.start_time = time.time()
+
+    def stream():
+        message = None
+        try:
+            for chunk in model.stream(messages, *args, **kwargs):
+                message = chunk if message is None else message + chunk
+                with streamed.condition:
+                    streamed.content = message.content
+                    streamed.condition.notify_all()
+            response = AIMessage(
+                content=message.content if message is not None else "",
+                usage_metadata=message.usage_metadata if message is not None else None,
+                response_metadata=message.response_metadata if message is not None else {},
+            )
+        except BaseException as e:
+            if limiter is not None:
+                limiter.release(estimated_tokens)
+            streamed._finish(None, e)
+            return
+        if limiter is not None:
+            limiter.release(estimated_tokens, used_tokens(response))
+        log_response(response, key, time.time() - streamed.start_time, prefix, limit_info)
+        streamed._finish(response)
+
+    threading.Thread(target=stream, name=f"{prefix.strip().lower() or 'llm'}_stream", daemon=True).start()
+    return streamed
@@ -0,0 +1,114 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class LLMCacheMiss(RuntimeError):
+    pass
+
+
+def canonical_message(message):
+    # Langchain messages are reduced to their role and content, dicts and tuples are already canonical
+    if hasattr(message, "type") and hasattr(message, "content"):
+        return {"role": message.type, "content": message.content}
+    return message
+
+
+def cache_key(model, messages: list, kwargs: dict, attempt: int = 0) -> str:
+    """
+    Hashes everything that determines a response: the provider, model, temperature, invoke arguments and messages.
+    Retries of a request whose response could not be used pass their attempt, so that they get a response of their
+    own instead of the cached one that failed.
+    """
+    params = {
+        "provider": type(model).__name__,
+        "base_url": getattr(model, "openai_api_base", None) or getattr(model, "base_url", None),
+        "model": getattr(model, "model_name", None) or getattr(model, "model", None),
+        "temperature": getattr(model, "temperature", None),
+        "kwargs": kwargs,
+        "messages": [canonical_message(message) for message in messages],
+        "attempt": attempt,
+    }
+    data = json.dumps(params, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    """
+    On-disk cache of LLM responses in a SQLite database.
+
+    Responses are stored as JSON under the key of their request (see cache_key). Once the cached responses exceed
+    max_mb, the least recently used ones are evicted. In replay mode requests that are not in the cache raise
+    LLMCacheMiss instead of being sent, so reruns can be checked to be fully offline.
+    """
+
+    def __init__(self, path: str, max_mb: float = 1024, replay: bool = False):
+        self.path = path
+        self.max_bytes = int(max_mb * 1e6)
+        self.replay = replay
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS responses "
+            "(key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)")
+        self.connection.commit()
+        self.size = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        logger.info(f"LLM cache {path}: {self.size / 1e6:.1f} MB{' (replay only)' if replay else ''}")
+
+    def get(self, key: str) -> Optional[dict]:
+        with self.lock:
+            row = self.connection.execute("SELECT value FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                if self.replay:
+                    raise LLMCacheMiss(f"LLM response {key} is not in the cache {self.path}")
+                return None
+            self.hits += 1
+            self.connection.execute("UPDATE responses SET last_used = ? WHERE key = ?", (time.time(), key))
+            self.connection.commit()
+        return json.loads(row[0])
+
+    def put(self, key: str, value: dict):
+        data = json.dumps(value, separators=(",", ":"))
+        size = len(data.encode("utf-8"))
+        with self.lock:
+            row = self.connection.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                self.size -= row[0]
+            self.connection.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, last_used) VALUES (?, ?, ?, ?)",
+                (key, data, size, time.time()),
+            )
+            self.size += size
+            self._evict()
+            self.connection.commit()
+
+    def _evict(self):
+        while self.size > self.max_bytes:
+            rows = self.connection.execute(
+                "SELECT key, size FROM responses ORDER BY last_used LIMIT 64"
+            ).fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                if self.size <= self.max_bytes:
+                    break
+                self.connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.size -= size
+
+    def stats(self) -> str:
+        return f"hits: {self.hits}, misses: {self.misses}"
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
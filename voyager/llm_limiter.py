@@ -0,0 +1,197 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import threading
+import time
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Lower values are served first. Action calls decide what the bots do next, everything else can wait for them.
+ACTION_PRIORITY = 0
+DEFAULT_PRIORITY = 1
+
+# How often requests waiting on an event loop check whether they may be sent
+ASYNC_POLL_INTERVAL = 0.05
+
+PROVIDERS = {
+    "ChatOpenAI": "openai",
+    "ChatDeepSeek": "deepseek",
+    "ChatOllama": "ollama",
+}
+
+
+def provider_name(model) -> str:
+    provider = PROVIDERS.get(type(model).__name__, type(model).__name__)
+    if "openrouter" in str(getattr(model, "openai_api_base", None) or ""):
+        provider = "openrouter"
+    return provider
+
+
+def estimate_tokens(messages: list) -> int:
+    # About four characters per token, corrected with the actual usage once the response arrives
+    characters = sum(len(str(getattr(message, "content", message))) for message in messages)
+    return characters // 4 + 1
+
+
+class RateLimiter:
+    """
+    Token buckets for the requests and tokens per minute of one provider and model, plus a limit on concurrent requests.
+
+    Callers queue by priority, then in order of arrival. A request is let through once the head of the queue fits in
+    both buckets; requests larger than the token bucket only wait for it to be full. Limits of 0 are not enforced.
+    """
+
+    def __init__(self, name: str, rpm: float = 0, tpm: float = 0, concurrency: int = 0):
+        self.name = name
+        self.rpm = rpm
+        self.tpm = tpm
+        self.concurrency = concurrency
+        self.request_budget = float(rpm)
+        self.token_budget = float(tpm)
+        self.active = 0
+        self.queue: list[tuple[int, int]] = []
+        self.counter = itertools.count()
+        self.condition = threading.Condition()
+        self.last_refill = time.time()
+        self.requests = 0
+        self.total_wait = 0.0
+        self.max_queue_depth = 0
+
+    def _refill(self):
+        now = time.time()
+        elapsed = now - self.last_refill
+        self.last_refill = now
+        self.request_budget = min(self.rpm, self.request_budget + elapsed * self.rpm / 60)
+        self.token_budget = min(self.tpm, self.token_budget + elapsed * self.tpm / 60)
+
+    def _wait_time(self, tokens: int) -> Optional[float]:
+        """
+        Returns how long until a request of tokens fits, 0 if it fits now, or None if it waits for a release.
+        """
+        if self.concurrency and self.active >= self.concurrency:
+            return None
+        wait = 0.0
+        if self.rpm and self.request_budget < 1:
+            wait = max(wait, (1 - self.request_budget) * 60 / self.rpm)
+        if self.tpm and self.token_budget < min(tokens, self.tpm):
+            wait = max(wait, (min(tokens, self.tpm) - self.token_budget) * 60 / self.tpm)
+        return wait
+
+    def _enqueue(self, priority: int) -> tuple[tuple[int, int], int]:
+        entry = (priority, next(self.counter))
+        with self.condition:
+            queue_depth = len(self.queue)
+            self.max_queue_depth = max(self.max_queue_depth, queue_depth + 1)
+            heapq.heappush(self.queue, entry)
+        return entry, queue_depth
+
+    def _take(self, entry: tuple[int, int], tokens: int) -> Optional[float]:
+        """
+        Lets entry through if it is at the head of the queue and fits, which returns 0. Otherwise returns the time to
+        wait, or None if the wait ends with a release or another request. Call with the condition held.
+        """
+        self._refill()
+        wait = self._wait_time(tokens) if self.queue[0] == entry else None
+        if wait != 0:
+            return wait
+        heapq.heappop(self.queue)
+        self.active += 1
+        self.request_budget -= 1
+        self.token_budget -= tokens
+        self.requests += 1
+        # The next request in the queue may fit as well
+        self.condition.notify_all()
+        return 0
+
+    def _leave(self, entry: tuple[int, int]):
+        with self.condition:
+            if entry in self.queue:
+                self.queue.remove(entry)
+                heapq.heapify(self.queue)
+                self.condition.notify_all()
+
+    def acquire(self, tokens: int, priority: int = DEFAULT_PRIORITY) -> tuple[float, int]:
+        """
+        Blocks until the request may be sent. Returns the time waited and the queue depth on arrival.
+        """
+        start_time = time.time()
+        entry, queue_depth = self._enqueue(priority)
+        with self.condition:
+            while (wait := self._take(entry, tokens)) != 0:
+                self.condition.wait(wait)
+            waited = time.time() - start_time
+            self.total_wait += waited
+        return waited, queue_depth
+
+    async def acquire_async(self, tokens: int, priority: int = DEFAULT_PRIORITY) -> tuple[float, int]:
+        """
+        Like acquire, but waits without blocking the event loop or a thread. Requests waiting in threads are woken by
+        the condition, those on the event loop check again every ASYNC_POLL_INTERVAL.
+        """
+        start_time = time.time()
+        entry, queue_depth = self._enqueue(priority)
+        try:
+            while True:
+                with self.condition:
+                    wait = self._take(entry, tokens)
+                    if wait == 0:
+                        waited = time.time() - start_time
+                        self.total_wait += waited
+                        return waited, queue_depth
+                await asyncio.sleep(ASYNC_POLL_INTERVAL if wait is None else min(wait, ASYNC_POLL_INTERVAL))
+        except asyncio.CancelledError:
+            self._leave(entry)
+            raise
+
+    def release(self, estimated_tokens: int, used_tokens: Optional[int] = None):
+        with self.condition:
+            self.active -= 1
+            if used_tokens is not None:
+                self.token_budget -= used_tokens - estimated_tokens
+            self.condition.notify_all()
+
+    def stats(self) -> dict:
+        with self.condition:
+            return {
+                "requests": self.requests,
+                "queued": len(self.queue),
+                "max_queue_depth": self.max_queue_depth,
+                "total_wait": round(self.total_wait, 2),
+            }
+
+
+class RateLimits:
+    """
+    The process-wide rate limiters, created on first use from limits keyed by "<provider>/<model>" or "<provider>",
+    e.g. {"openai": {"rpm": 500, "tpm": 200000, "concurrency": 8}}. Limits of a model get a limiter of their own,
+    all models of a provider that only has provider limits share one. Models without limits are not limited.
+    """
+
+    def __init__(self, limits: Optional[dict[str, dict[str, float]]] = None):
+        self.limits = limits or {}
+        self.limiters: dict[str, Optional[RateLimiter]] = {}
+        self.lock = threading.Lock()
+
+    def get(self, model) -> Optional[RateLimiter]:
+        provider = provider_name(model)
+        name = f"{provider}/{getattr(model, 'model_name', None) or getattr(model, 'model', None)}"
+        if name not in self.limits:
+            name = provider
+        with self.lock:
+            if name not in self.limiters:
+                limits = self.limits.get(name)
+                self.limiters[name] = None if not limits else RateLimiter(
+                    name,
+                    rpm=limits.get("rpm", 0),
+                    tpm=limits.get("tpm", 0),
+                    concurrency=int(limits.get("concurrency", 0)),
+                )
+            return self.limiters[name]
+
+    def log_stats(self):
+        with self.lock:
+            limiters = [limiter for limiter in self.limiters.values() if limiter is not None]
+        for limiter in limiters:
+            logger.info(f"Rate limiter {limiter.name}: {limiter.stats()}")
@@ -3,6 +3,7 @@ import threading
 
 from voyager import Voyager
 from voyager.llm import invoke_with_log
+from voyager.llm_limiter import ACTION_PRIORITY
 from voyager.negotiation import Negotiation, Negotiator
 import time
 import voyager.utils as U
@@ -416,7 +417,8 @@ class MultiAgentVoyager:
         def get_ai_message_parse(agent, result):
             if agent.action_agent_rollout_num_iter < 0:
                 raise ValueError("Agent must be reset before stepping")
-            ai_message = invoke_with_log(agent.action_agent.llm, agent.messages, prefix="Action ")
+            ai_message = invoke_with_log(agent.action_agent.llm, agent.messages, prefix="Action ",
+                                         priority=ACTION_PRIORITY)
             agent.logger(f"\033[34m****Action Agent ai message****\n{ai_message.content}\033[0m")
             agent.conversations.append(
                 (agent.messages[0].content, agent.messages[1].content, ai_message.content)
@@ -1,5 +1,6 @@
 import logging
 
+import voyager.utils as U
 from voyager.llm import create_llm, invoke_with_log
 from voyager.prompts import load_prompt
 
@@ -62,18 +63,22 @@ class Negotiation:
         self.tactics = None
         self.agent1.reset()
 
+    def close_log(self):
+        U.close_logger(self.log_file)
+
     def setup_custom_logger(self):
         """
         Set up a custom logger with the given name and log file.
         """
         filename = 'negotiation' if self.team_name is None else f'negotiation_{self.team_name}'
         log_file = f'{self.save_dir}/{filename}.ansi'
+        self.log_file = log_file
 
         formatter = logging.Formatter(fmt='%(message)s')
         handler = logging.FileHandler(log_file, mode='w')  # Change to 'a' if you want to append
         handler.setFormatter(formatter)
 
-        logger = logging.getLogger('negotiation')
+        logger = logging.getLogger(log_file)
         # Clear existing handlers from previous runs
         for h in logger.handlers:
             logger.removeHandler(h)
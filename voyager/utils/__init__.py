@@ -1,4 +1,5 @@
 from .file_utils import *
 from .json_utils import *
 from .chat_utils import *
+from .log_utils import *
 from .record_utils import EventRecorder
@@ -10,38 +10,56 @@ def spawn_commands(usernames, spawn_locations):
     return ''.join(commands)
 
 
-def spawn_commands_2(usernames: list[list[str]], spawn_locations: list[list[tuple[int, int, int]]]):
+def chat_commands(server_commands: list[str]):
+    # Runs server console commands as chat commands of the bot
+    return ''.join(f"bot.chat('/{command}');" for command in server_commands)
+
+
+def spawn_server_commands_2(usernames: list[list[str]], spawn_locations: list[list[tuple[int, int, int]]]):
     commands = []
     for i, team in enumerate(spawn_locations):
         for j, pos in enumerate(team):
             name = usernames[i][j]
-            commands.append(f"bot.chat('/tp {name} {pos[0]} {pos[1]} {pos[2]}');")
-    return ''.join(commands)
+            commands.append(f"tp {name} {pos[0]} {pos[1]} {pos[2]}")
+    return commands
+
+
+def spawn_commands_2(usernames: list[list[str]], spawn_locations: list[list[tuple[int, int, int]]]):
+    return chat_commands(spawn_server_commands_2(usernames, spawn_locations))
+
+
+def gamemode_server_commands(usernames: list[list[str]], gamemode):
+    return [f"gamemode {gamemode} {name}" for team in usernames for name in team]
 
 
 def gamemode_commands(usernames: list[list[str]], gamemode):
-    commands = []
-    for team in usernames:
-        for name in team:
-            commands.append(f"bot.chat('/gamemode {gamemode} {name}');")
-    return ''.join(commands)
+    return chat_commands(gamemode_server_commands(usernames, gamemode))
 
 
-def scores_teams_commands(usernames: list[list[str]], team_names: list[str], team_colors: list[str]):
+def scores_teams_server_commands(usernames: list[list[str]], team_names: list[str], team_colors: list[str]):
     commands = [
-        "bot.chat('/scoreboard objectives add Scores dummy');",
-        "bot.chat('/scoreboard objectives setdisplay sidebar Scores');"
+        "scoreboard objectives add Scores dummy",
+        "scoreboard objectives setdisplay sidebar Scores"
     ]
     for i, team in enumerate(usernames):
         team_name = team_names[i]
         team_color = team_colors[i]
-        commands.append(f"bot.chat('/scoreboard players set {team_name} Scores 0');")
-        commands.append(f"bot.chat('/team add {team_name}');")
-        commands.append(f"bot.chat('/team modify {team_name} color {team_color}');")
-        commands.append(f"bot.chat('/team join {team_name} {team_name}');")
+        commands.append(f"scoreboard players set {team_name} Scores 0")
+        commands.append(f"team add {team_name}")
+        commands.append(f"team modify {team_name} color {team_color}")
+        commands.append(f"team join {team_name} {team_name}")
         for name in team:
-            commands.append(f"bot.chat('/team join {team_name} {name}');")
-    return ''.join(commands)
+            commands.append(f"team join {team_name} {name}")
+    return commands
+
+
+def scores_teams_commands(usernames: list[list[str]], team_names: list[str], team_colors: list[str]):
+    return chat_commands(scores_teams_server_commands(usernames, team_names, team_colors))
+
+
+def reset_scores_teams_server_commands(team_names: list[str]):
+    # Server console commands that undo scores_teams_commands
+    return ["scoreboard objectives remove Scores"] + [f"team remove {team_name}" for team_name in team_names]
 
 
 def add_block_commands(block_positions):
@@ -0,0 +1,14 @@
+import logging
+
+
+def close_logger(name: str):
+    """
+    Closes the handlers of a logger and removes it from the logging registry. Loggers keyed by the log file of an
+    episode are otherwise kept until the process exits.
+    """
+    logger = logging.Logger.manager.loggerDict.pop(name, None)
+    if not isinstance(logger, logging.Logger):
+        return
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+        handler.close()
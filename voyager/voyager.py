@@ -124,6 +124,7 @@ class Voyager:
 
         # setup logging
         U.f_mkdir(f"{ckpt_dir}/")
+        self.log_file = None
         logger = self.setup_custom_logger(use_logging=True, save_dir=ckpt_dir)
         self.logger = logger
 
@@ -199,12 +200,13 @@ class Voyager:
         if use_logging:
             # store file one directory up (hacky)
             log_file = f'{save_dir}/../{self.username}.ansi'
+            self.log_file = log_file
 
             formatter = logging.Formatter(fmt='%(message)s')
             handler = logging.FileHandler(log_file, mode='a')  # Change to 'a' if you want to append
             handler.setFormatter(formatter)
 
-            logger = logging.getLogger(self.username)
+            logger = logging.getLogger(log_file)
             # Clear existing handlers from previous runs
             for h in logger.handlers:
                 logger.removeHandler(h)
@@ -215,6 +217,11 @@ class Voyager:
 
         return print
 
+    def close_log(self):
+        if self.log_file is not None:
+            U.close_logger(self.log_file)
+            self.log_file = None
+
     def reset(self, task, tactics="", scenario="", context="", events=None, reset_env=False):
         self.action_agent_rollout_num_iter = 0
         self.task = task